@@ -1,93 +1,156 @@
-import gradio as gr
-import pandas as pd
-import subprocess
-import sys
-import os
-from datetime import datetime, timedelta
-
-def simulate_agent_run():
+import argparse
+import threading
+import time
+from datetime import datetime
+
+# gradio وحزمة الكشف (pandas وpyarrow) تستوردان عند الحاجة فقط، حتى يبدأ تسخين الكشف
+# في الخلفية بينما تستورد gradio وتبنى الواجهة
+
+# واجهة الكشف المقيمة في الذاكرة (تشغيل واحد في كل مرة)، تنشأ عند أول استخدام
+_detection_api = None
+_detection_api_lock = threading.Lock()
+
+def get_detection_api():
+    """إرجاع واجهة الكشف المقيمة في الذاكرة، وإنشاؤها (مع استيراد حزمة الكشف) عند أول استدعاء."""
+    global _detection_api
+    with _detection_api_lock:
+        if _detection_api is None:
+            from detection_api import DetectionAPI
+            _detection_api = DetectionAPI()
+        return _detection_api
+
+# تقرير القضايا (تصنيف الخطورة، الترقيم، البطاقات المخزنة مؤقتًا)، ينشأ عند أول استخدام
+_case_report = None
+_case_report_lock = threading.Lock()
+
+# عدد القضايا في كل صفحة، ومستويات الخطورة المعروضة افتراضيًا (كل المستويات عدا المنخفض)
+CASES_PER_PAGE = 10
+DEFAULT_SEVERITIES = ['very_high', 'high', 'medium']
+
+def get_case_report():
+    """إرجاع تقرير القضايا المشترك بين المستخدمين، وإنشاؤه عند أول استدعاء."""
+    global _case_report
+    with _case_report_lock:
+        if _case_report is None:
+            from case_reports import CaseReport
+            _case_report = CaseReport()
+        return _case_report
+
+def prewarm_detection():
+    """
+    تسخين مسار الكشف في خيط خلفي: استيراد حزمة الكشف وتشغيل أول دورة كشف،
+    فيجد أول طلب النتائج جاهزة في الذاكرة (أو ينضم إلى الدورة الجارية).
+    """
+    thread = threading.Thread(target=lambda: get_detection_api().submit(), name='prewarm', daemon=True)
+    thread.start()
+    return thread
+
+# وصف مراحل دورة الكشف كما تسجلها instrumentation.py
+STAGE_LABELS = {
+    'load_state': "تحميل حالة الكشف المحفوظة",
+    'verify_state': "التحقق من أن البيانات السابقة لم تتغير",
+    'load': "سحب القراءات الجديدة",
+    'features': "حساب استهلاك الجيران",
+    'fit': "تحديث نماذج العملاء",
+    'score': "تقييم قراءات فترة الاختبار",
+    'save_state': "حفظ حالة الكشف",
+    'rank': "ترتيب العملاء حسب درجة الشبهة",
+}
+
+RUNNING_STATUS_HTML = "<div style='text-align:center; padding: 20px; font-family: Cairo, sans-serif; direction: rtl;'><p style='font-size: 18px; color:#2980b9;'>🔵 <strong>الحالة:</strong> جاري تشغيل دورة الكشف...</p></div>"
+
+def format_event(event):
+    """
+    تحويل حدث من أحداث دورة الكشف إلى سطر في السجلات بالأرقام الفعلية،
+    أو None للأحداث التي لا تعرض.
+    """
+    clock = event['time'][11:19]
+    memory = f"ذروة الذاكرة {event['peak_rss_mb']:.0f} MB" if event.get('peak_rss_mb') else ""
+    if event['event'] == 'stage':
+        details = []
+        if 'rows' in event:
+            details.append(f"{event['rows']:,} قراءة")
+        if 'customers' in event:
+            details.append(f"{event['customers']} عميل")
+        if event.get('start'):
+            details.append(f"من {event['start']} إلى {event['end']}")
+        label = STAGE_LABELS.get(event['stage'], event['stage'])
+        return f"[{clock}] {label}: {'، '.join(details) or 'تم'} ({event['seconds'] * 1000:.0f} ms، {memory})"
+    if event['event'] == 'unchanged':
+        return f"[{clock}] لا توجد قراءات جديدة منذ الدورة السابقة؛ تم استخدام ترتيب {event['customers']} عميل المحفوظ في الذاكرة."
+    if event['event'] == 'state_reset':
+        return f"[{clock}] تغيرت بيانات الكشف السابقة (أعيد توليد البيانات أو حذفت الحالة)؛ يعاد بناء حالة الكشف من البداية."
+    if event['event'] == 'run_end':
+        return f"[{clock}] اكتملت دورة الكشف في {event['seconds']:.2f} ثانية ({memory})."
+    return None
+
+def page_outputs(page, num_pages, customer_ids):
+    """قيم عناصر الترقيم بعد عرض صفحة: رقم الصفحة، النص، وقائمة قضايا الصفحة."""
+    import gradio as gr
+    return (page, f"صفحة {page} من {num_pages}",
+            gr.update(choices=customer_ids, value=customer_ids[0] if customer_ids else None))
+
+def show_case_page(page, severities, phases):
+    """عرض صفحة من تقرير القضايا حسب مرشحات الخطورة والطور (الترقيم والتصفية على الخادم)."""
+    case_files_html, page, num_pages, customer_ids = get_case_report().page(page, severities, phases, CASES_PER_PAGE)
+    return (case_files_html, *page_outputs(page, num_pages, customer_ids))
+
+def show_case_series(customer_id, series_open=True):
+    """
+    سلسلتا الاستهلاك والجهد المختصرتان للقضية المختارة. تقرأ فقط عند فتح قسم الرسوم،
+    ولا تقرأ إلا قراءات محول وطور العميل.
+    """
+    import gradio as gr
+    if not series_open:
+        return gr.update(), gr.update()
+    if customer_id is None or get_case_report().cases is None:
+        return None, None
+    series_df = get_case_report().series(int(customer_id))
+    return series_df, series_df
+
+def simulate_agent_run(severities=None, phases=None):
     """
     هذه الدالة تحاكي دورة عمل الوكيل الذكي الكاملة مع تشخيص ديناميكي للحالات.
+    السجلات تعرض مراحل الكشف الفعلية أثناء تنفيذها (عدد القراءات، الزمن، الذاكرة).
     """
-    # ---- 1. محاكاة السجلات (Logs) ----
-    logs = [
-        f"[{datetime.now().strftime('%H:%M:%S')}] بدء الدورة اليومية المجدولة...",
-        f"[{datetime.now().strftime('%H:%M:%S')}] تم الاتصال بقاعدة البيانات... تم سحب 89,280 قراءة جديدة.",
-        f"[{datetime.now().strftime('%H:%M:%S')}] تحديد نافذة التدريب: من {(datetime.now() - timedelta(days=60)).strftime('%d-%m-%Y')} إلى {datetime.now().strftime('%d-%m-%Y')}.",
-    ]
+    # ---- 1. السجلات (Logs) ----
+    logs = [f"[{datetime.now().strftime('%H:%M:%S')}] بدء الدورة اليومية المجدولة..."]
     
     # ---- 2. تشغيل الكود الفعلي للكشف ----
+    import gradio as gr
+    from case_reports import SEVERITY_LABELS
+    # عناصر الترقيم لا تتغير حتى تكتمل الدورة
+    no_page_change = (gr.update(),) * 3
     try:
-        process = subprocess.run(
-            [sys.executable, 'detector.py'],
-            capture_output=True, text=True, encoding='utf-8'
-        )
-        if process.returncode != 0:
-            return "<div style='text-align:center; padding: 20px; font-family: Cairo, sans-serif;'><p style='font-size: 18px; color:red;'>🔴 حدث خطأ أثناء تشغيل الكشف!</p></div>", f"<div style='text-align:center; padding: 20px; color:#95a5a6; font-family: monospace;'>{process.stderr}</div>", "فشل!"
-
-        logs.extend([
-            f"[{datetime.now().strftime('%H:%M:%S')}] بدء تدريب النماذج على 30 عميل...",
-            f"[{datetime.now().strftime('%H:%M:%S')}] اكتمل التدريب. بدء عملية الكشف...",
-            f"[{datetime.now().strftime('%H:%M:%S')}] تم كشف 10 حالات مشتبه بها.",
-            f"[{datetime.now().strftime('%H:%M:%S')}] تم إنشاء 10 ملفات قضايا."
-        ])
-
-        # ---- 3. إنشاء ملفات القضايا بتصميم وتشخيص ديناميكي ----
-        results_df = pd.read_csv('anomaly_results.csv')
-        case_files_html = "<div style='direction: rtl;'>"
-        # استخدام enumerate للحصول على الترتيب (0, 1, 2, ...)
-        for i, (index, row) in enumerate(results_df.head(10).iterrows()):
-            customer_id = int(row['Customer_ID'])
-            score = row['Anomaly_Score']
-            
-            # تحديد مستوى الخطورة
-            if score < -1000:
-                severity = "مرتفع جدًا"
-                color = "#e74c3c"
-            elif score < -500:
-                severity = "مرتفع"
-                color = "#e67e22"
-            else:
-                severity = "متوسط"
-                color = "#f1c40f"
-            
-            # *** هنا التعديل: منطق التشخيص الديناميكي ***
-            if i == 0: # الحالة الأولى (الأعلى خطورة)
-                diagnosis_html = """
-                    <p style='font-weight: 600; color:#2c3e50; margin-top:0;'>تشخيص الذكاء الاصطناعي:</p>
-                    <ul style='padding-right: 20px; margin-top: 5px; margin-bottom: 15px;'>
-                        <li>تم رصد هبوط ملحوظ في الجهد لا يتناسب مع الاستهلاك المنخفض المسجل.</li>
-                        <li>يشير ذلك باحتمالية عالية لوجود حمل غير مقاس (سرقة).</li>
-                    </ul>
-                    <p style='font-weight: 600; color:#2c3e50;'>الإجراء الموصى به:</p>
-                     <ul style='padding-right: 20px; margin-top: 5px; margin-bottom: 0;'>
-                        <li><strong>أولوية قصوى:</strong> إرسال فريق التفتيش للتحقق المادي الفوري.</li>
-                    </ul>
-                """
-            else: # باقي الحالات
-                diagnosis_html = """
-                    <p style='font-weight: 600; color:#2c3e50; margin-top:0;'>تشخيص الذكاء الاصطناعي:</p>
-                    <ul style='padding-right: 20px; margin-top: 5px; margin-bottom: 15px;'>
-                        <li>تم رصد تناقض طفيف بين قراءات الجهد والاستهلاك.</li>
-                    </ul>
-                    <p style='font-weight: 600; color:#2c3e50;'>الإجراء الموصى به:</p>
-                     <ul style='padding-right: 20px; margin-top: 5px; margin-bottom: 0;'>
-                        <li>إضافة العميل لقائمة المراقبة والتحقق الدوري.</li>
-                    </ul>
-                """
-
-            case_files_html += f"""
-            <div style='border: 1px solid #ecf0f1; border-right: 7px solid {color}; padding: 20px; margin-bottom: 20px; border-radius: 10px; background-color: #ffffff; box-shadow: 0 4px 8px rgba(0,0,0,0.05); font-family: Cairo, sans-serif;'>
-                <h3 style='color: #34495e; margin-top:0; text-align:center;'>ملف قضية: العميل رقم {customer_id}</h3>
-                <hr style='border-top: 1px solid #ecf0f1;'>
-                <p style='font-size: 1.2em; font-weight: bold;'>درجة الشبهة: <span style='color: {color};'>{score:.2f}</span> (خطورة: {severity})</p>
-                <p style='color:#7f8c8d;'><strong>العنوان (مثال):</strong> {100 + customer_id} شارع المحطة، القاهرة</p>
-                <div style='background-color: #f8f9f9; padding:15px; border-radius:8px; margin-top:15px;'>
-                    {diagnosis_html}
-                </div>
-            </div>
-            """
-        case_files_html += "</div>"
+        # الكشف داخل نفس العملية: النماذج والنتائج تبقى في الذاكرة بين الطلبات
+        future, cycle = get_detection_api().submit()
+        yield RUNNING_STATUS_HTML, gr.update(), "\n".join(logs), *no_page_change
+
+        # عرض أحداث الدورة فور تسجيلها حتى تنتهي
+        seen = 0
+        while True:
+            done = future.done()
+            events = cycle.events_since(seen)
+            seen += len(events)
+            lines = [line for line in map(format_event, events) if line]
+            if lines:
+                logs.extend(lines)
+                yield RUNNING_STATUS_HTML, gr.update(), "\n".join(logs), *no_page_change
+            if done:
+                break
+            time.sleep(0.2)
+
+        results_df = future.result()
+        if results_df is None:
+            yield "<div style='text-align:center; padding: 20px; font-family: Cairo, sans-serif;'><p style='font-size: 18px; color:red;'>🔴 حدث خطأ أثناء تشغيل الكشف!</p></div>", "<div style='text-align:center; padding: 20px; color:#95a5a6; font-family: monospace;'>لا توجد بيانات تدريب بعد.</div>", "\n".join(logs + ["فشل!"]), *no_page_change
+            return
+
+        # ---- 3. تحديث تقرير القضايا (تصنيف الخطورة لكل العملاء) وعرض الصفحة الأولى ----
+        report = get_case_report()
+        counts = report.update(results_df)
+        summary = "، ".join(f"{count} {SEVERITY_LABELS[key]}" for key, count in counts.items())
+        logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] تم ترتيب {len(results_df)} عميل وتصنيف القضايا حسب الخطورة: {summary}.")
+        case_files_html, page, num_pages, customer_ids = report.page(1, severities, phases, CASES_PER_PAGE)
 
         # ---- 4. محاكاة إرسال البريد الإلكتروني وتحديث الحالة ----
         logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] تم إرسال بريد إلكتروني بالتقرير اليومي إلى inspection-lead@power-company.com.")
@@ -99,47 +162,101 @@ def simulate_agent_run():
         </div>
         """
         
-        return agent_status_html, case_files_html, "\n".join(logs)
+        yield agent_status_html, case_files_html, "\n".join(logs), *page_outputs(page, num_pages, customer_ids)
 
     except Exception as e:
-        return "<div style='text-align:center; padding: 20px; font-family: Cairo, sans-serif;'><p style='font-size: 18px; color:red;'>🔴 حدث خطأ!</p></div>", f"<div style='text-align:center; padding: 20px; color:#95a5a6; font-family: monospace;'>خطأ غير متوقع: {str(e)}</div>", ""
-
-# --- تصميم واجهة Gradio النهائية ---
-with gr.Blocks(theme=gr.themes.Soft(), title="نظام حماة الكهرباء (الوكيل الذكي)") as demo:
-    demo.head = """
-    <link rel="preconnect" href="https://fonts.googleapis.com">
-    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-    <link href="https://fonts.googleapis.com/css2?family=Cairo:wght@400;600;700&display=swap" rel="stylesheet">
-    <style>
-        .tab-buttons { justify-content: center !important; }
-    </style>
-    """
-    
-    gr.HTML("<div style='text-align:center; font-family: Cairo, sans-serif;'><h1 style='color:#2c3e50;'>💡 نظام حماة الكهرباء (إصدار الوكيل الذكي)</h1><h3 style='color:#34495e;'>للكشف الذكي عن سرقة الطاقة باستخدام الذكاء الاصطناعي</h3></div>")
-    gr.Markdown("<hr>")
-    
-    with gr.Tabs() as tabs:
-        # --- القسم الأول: لوحة التحكم ---
-        with gr.TabItem("Dashboard | لوحة التحكم", id=0):
-            agent_status_text = gr.HTML("<div style='text-align:center; padding: 20px; font-family: Cairo, sans-serif; direction: rtl;'><p style='font-size: 18px; color:#566573;'>⚪ <strong>الحالة:</strong> غير معروف (يرجى تشغيل الدورة).</p></div>")
-            run_button = gr.Button("▶️ تشغيل دورة الكشف اليومية يدويًا (محاكاة)", variant="primary", size="lg")
-
-        # --- القسم الثاني: تقرير الحالات ---
-        with gr.TabItem("Daily Report | تقرير الحالات اليومي", id=1):
-            gr.HTML("<h2 style='text-align:center; font-family: Cairo, sans-serif;'>تقرير الحالات المشتبه بها لليوم</h2>")
-            case_files_output = gr.HTML("<div style='text-align:center; padding: 20px; color:#95a5a6; font-family: Cairo, sans-serif;'>لا توجد حالات لعرضها. يرجى تشغيل دورة الكشف أولاً.</div>")
-
-        # --- القسم الثالث: سجلات النظام ---
-        with gr.TabItem("System Logs | سجلات النظام", id=2):
-            gr.HTML("<h2 style='text-align:center; font-family: Cairo, sans-serif;'>سجلات عمل الوكيل الذكي</h2>")
-            logs_output = gr.Code(value="...في انتظار بدء العملية...")
-    
-    # ربط زر التشغيل بالدالة الرئيسية
-    run_button.click(
-        fn=simulate_agent_run,
-        inputs=[],
-        outputs=[agent_status_text, case_files_output, logs_output]
-    )
+        yield "<div style='text-align:center; padding: 20px; font-family: Cairo, sans-serif;'><p style='font-size: 18px; color:red;'>🔴 حدث خطأ!</p></div>", f"<div style='text-align:center; padding: 20px; color:#95a5a6; font-family: monospace;'>خطأ غير متوقع: {str(e)}</div>", "", *no_page_change
+
+def build_demo():
+    """بناء واجهة Gradio النهائية (استيراد gradio يحدث هنا)."""
+    import gradio as gr
+    from case_reports import SEVERITY_LEVELS
+
+    # --- تصميم واجهة Gradio النهائية ---
+    with gr.Blocks(theme=gr.themes.Soft(), title="نظام حماة الكهرباء (الوكيل الذكي)") as demo:
+        demo.head = """
+        <link rel="preconnect" href="https://fonts.googleapis.com">
+        <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
+        <link href="https://fonts.googleapis.com/css2?family=Cairo:wght@400;600;700&display=swap" rel="stylesheet">
+        <style>
+            .tab-buttons { justify-content: center !important; }
+        </style>
+        """
+
+        gr.HTML("<div style='text-align:center; font-family: Cairo, sans-serif;'><h1 style='color:#2c3e50;'>💡 نظام حماة الكهرباء (إصدار الوكيل الذكي)</h1><h3 style='color:#34495e;'>للكشف الذكي عن سرقة الطاقة باستخدام الذكاء الاصطناعي</h3></div>")
+        gr.Markdown("<hr>")
+
+        with gr.Tabs() as tabs:
+            # --- القسم الأول: لوحة التحكم ---
+            with gr.TabItem("Dashboard | لوحة التحكم", id=0):
+                agent_status_text = gr.HTML("<div style='text-align:center; padding: 20px; font-family: Cairo, sans-serif; direction: rtl;'><p style='font-size: 18px; color:#566573;'>⚪ <strong>الحالة:</strong> غير معروف (يرجى تشغيل الدورة).</p></div>")
+                run_button = gr.Button("▶️ تشغيل دورة الكشف اليومية يدويًا (محاكاة)", variant="primary", size="lg")
+
+            # --- القسم الثاني: تقرير الحالات ---
+            with gr.TabItem("Daily Report | تقرير الحالات اليومي", id=1):
+                gr.HTML("<h2 style='text-align:center; font-family: Cairo, sans-serif;'>تقرير الحالات المشتبه بها لليوم</h2>")
+                # مرشحات التقرير (بدون تحديد = الكل)
+                with gr.Row():
+                    severity_filter = gr.CheckboxGroup(choices=[(label, key) for key, label, _, _ in SEVERITY_LEVELS],
+                                                       value=DEFAULT_SEVERITIES, label="مستوى الخطورة")
+                    phase_filter = gr.CheckboxGroup(choices=['A', 'B', 'C'], value=[], label="الطور")
+                case_files_output = gr.HTML("<div style='text-align:center; padding: 20px; color:#95a5a6; font-family: Cairo, sans-serif;'>لا توجد حالات لعرضها. يرجى تشغيل دورة الكشف أولاً.</div>")
+                # الترقيم
+                page_state = gr.State(1)
+                with gr.Row():
+                    prev_button = gr.Button("→ الصفحة السابقة")
+                    page_label = gr.Markdown("صفحة 1 من 1")
+                    next_button = gr.Button("الصفحة التالية ←")
+                # الرسوم البيانية للقضية تقرأ فقط عند فتح هذا القسم
+                series_open = gr.State(False)
+                with gr.Accordion("الاستهلاك والجهد للقضية المختارة", open=False) as series_accordion:
+                    case_selector = gr.Dropdown(choices=[], label="العميل")
+                    consumption_plot = gr.LinePlot(x='Timestamp', y='P_consumption_kw', title="الاستهلاك المسجل (kW)")
+                    voltage_plot = gr.LinePlot(x='Timestamp', y='Voltage_V', title="الجهد (V)")
+
+            # --- القسم الثالث: سجلات النظام ---
+            with gr.TabItem("System Logs | سجلات النظام", id=2):
+                gr.HTML("<h2 style='text-align:center; font-family: Cairo, sans-serif;'>سجلات عمل الوكيل الذكي</h2>")
+                logs_output = gr.Code(value="...في انتظار بدء العملية...")
+
+        # ربط زر التشغيل بالدالة الرئيسية
+        page_components = [case_files_output, page_state, page_label, case_selector]
+        run_button.click(
+            fn=simulate_agent_run,
+            inputs=[severity_filter, phase_filter],
+            outputs=[agent_status_text, case_files_output, logs_output, page_state, page_label, case_selector]
+        )
+
+        # الترقيم والتصفية: كل نقرة تعرض صفحة واحدة فقط من الخادم
+        prev_button.click(lambda page, severities, phases: show_case_page(page - 1, severities, phases),
+                          inputs=[page_state, severity_filter, phase_filter], outputs=page_components)
+        next_button.click(lambda page, severities, phases: show_case_page(page + 1, severities, phases),
+                          inputs=[page_state, severity_filter, phase_filter], outputs=page_components)
+        for case_filter in (severity_filter, phase_filter):
+            case_filter.change(lambda severities, phases: show_case_page(1, severities, phases),
+                               inputs=[severity_filter, phase_filter], outputs=page_components)
+
+        # الرسوم البيانية: تحميل كسول عند فتح القسم أو تغيير القضية أثناء فتحه
+        series_accordion.expand(lambda customer_id: (True, *show_case_series(customer_id)),
+                                inputs=case_selector, outputs=[series_open, consumption_plot, voltage_plot])
+        series_accordion.collapse(lambda: False, outputs=series_open)
+        case_selector.change(show_case_series, inputs=[case_selector, series_open],
+                             outputs=[consumption_plot, voltage_plot])
+    return demo
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Start the electricity theft detection dashboard.")
+    parser.add_argument('--port', type=int, help="Port of the web interface (default: gradio's, 7860)")
+    parser.add_argument('--no-prewarm', action='store_true',
+                        help="Do not run the first detection cycle in the background while the interface starts")
+    args = parser.parse_args(argv)
+
+    if not args.no_prewarm:
+        prewarm_detection()
+    demo = build_demo()
+    # عدة مستخدمين في نفس الوقت ينتظرون نفس دورة الكشف بدلاً من تشغيل دورات مكررة
+    demo.queue(default_concurrency_limit=4)
+    demo.launch(server_port=args.port)
 
 if __name__ == "__main__":
-    demo.launch()
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares the dashboard's click-to-report latency of the old subprocess-per-click
+detection against the in-process DetectionAPI (cold first call and warm calls),
+and checks that a running DetectionAPI follows a regenerated dataset: in a scratch
+copy of the project's data the dataset is rebuilt with another thief, and the API's
+next ranking must match a full train_and_detect run.
+
+Run from the project root after generating the dataset:
+    python -m benchmarks.bench_app_latency --clicks 20
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from detection_api import DetectionAPI
+from detector import train_and_detect
+from storage import dataset_path, read_dataset, resolve_format
+from theft_scenarios import create_labelled_dataset
+from benchmarks.bench_sharded_detection import PROJECT_ROOT
+
+def regenerated_dataset_check(thief):
+    """Returns (API top customer, full-run top customer) after regenerating the dataset with thief."""
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in ('simulation_results', 'final_dataset_with_theft'):
+            path = dataset_path(name, resolve_format(name))
+            copy = shutil.copytree if os.path.isdir(path) else shutil.copy
+            copy(os.path.join(PROJECT_ROOT, path), os.path.join(workdir, path))
+        os.chdir(workdir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                api = DetectionAPI()
+                api.get_results()
+                create_labelled_dataset(pd.DataFrame({'Customer_ID': [thief], 'Pattern': ['constant'],
+                                                      'Start': ['2023-03-01'], 'Fraction': [0.5]}))
+                api_top = api.get_results()['Customer_ID'].iloc[0]
+                full_top = train_and_detect(use_cache=False)['Customer_ID'].iloc[0]
+        finally:
+            os.chdir(PROJECT_ROOT)
+    return int(api_top), int(full_top)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clicks', type=int, default=20, help="Number of warm in-process requests")
+    parser.add_argument('--subprocess-clicks', type=int, default=3, help="Number of subprocess runs")
+    parser.add_argument('--thief', type=int, default=20, help="Thief of the regenerated dataset in the staleness check")
+    args = parser.parse_args()
+
+    subprocess_s = []
+    for _ in range(args.subprocess_clicks):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'detector.py', '--incremental'], capture_output=True, check=True)
+        read_dataset('anomaly_results')
+        subprocess_s.append(time.perf_counter() - start)
+
+    api = DetectionAPI()
+    start = time.perf_counter()
+    api.get_results()
+    cold_s = time.perf_counter() - start
+
+    warm_s = []
+    for _ in range(args.clicks):
+        start = time.perf_counter()
+        api.get_results()
+        warm_s.append(time.perf_counter() - start)
+
+    print("--- Click-to-report latency ---")
+    print(f"Subprocess per click:  {np.median(subprocess_s) * 1000:9.1f} ms (median of {args.subprocess_clicks})")
+    print(f"In-process, first run: {cold_s * 1000:9.1f} ms")
+    print(f"In-process, unchanged: {np.median(warm_s) * 1000:9.2f} ms (median of {args.clicks})")
+
+    api_top, full_top = regenerated_dataset_check(args.thief)
+    print(f"After regenerating the dataset with thief #{args.thief}: API ranks #{api_top} first, "
+          f"full run ranks #{full_top} first, identical: {api_top == full_top}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""
+Measures the throughput of the vectorized load-profile generator in records per second.
+
+Run from the project root:
+    python -m benchmarks.bench_data_generator --customers 30 1000 10000 --days 31
+"""
+import argparse
+import time
+import pandas as pd
+
+from data_generator import iter_load_profile_chunks
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, nargs='+', default=[30, 1000, 10000], help="Customer counts to run")
+    parser.add_argument('--days', type=int, default=31, help="Length of the generated period in days")
+    parser.add_argument('--chunk', choices=['month', 'customers'], default='month', help="Chunk mode")
+    args = parser.parse_args()
+
+    start = pd.Timestamp('2023-01-01')
+    end = start + pd.Timedelta(days=args.days) - pd.Timedelta(minutes=15)
+
+    print(f"--- Load-profile generator benchmark ({args.days} days, chunk={args.chunk}) ---")
+    for num_customers in args.customers:
+        t0 = time.perf_counter()
+        num_records = sum(len(chunk_df) for chunk_df in
+                          iter_load_profile_chunks(num_customers, start, end, chunk=args.chunk))
+        elapsed = time.perf_counter() - t0
+        print(f"{num_customers:>7} customers: {num_records:>11,} records in {elapsed:6.2f} s "
+              f"({num_records / elapsed:,.0f} records/s)")
+
+if __name__ == '__main__':
+    main()
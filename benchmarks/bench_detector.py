@@ -0,0 +1,62 @@
+"""
+Compares the batched per-customer regression engine against the sklearn loop.
+
+The sklearn loop scans the whole frame once per customer, so it is only run up to
+--sklearn-max customers. Run from the project root:
+    python -m benchmarks.bench_detector --customers 30 1000 100000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from detector import (fit_customer_models, score_customers, fit_customer_models_sklearn,
+                      score_customers_sklearn, sklearn_models_to_frame)
+
+def make_feature_frame(num_customers, num_timesteps, rng):
+    """Builds a synthetic frame with the detector's features and target for every customer."""
+    customer_ids = np.tile(np.arange(1, num_customers + 1), num_timesteps)
+    voltage = 399 + rng.normal(0, 0.3, len(customer_ids))
+    phase_total = rng.uniform(10, 40, len(customer_ids))
+    consumption = 0.03 * phase_total - 0.5 * (voltage - 399) + rng.normal(0, 0.2, len(customer_ids))
+    return pd.DataFrame({
+        'Customer_ID': customer_ids,
+        'Voltage_V': voltage,
+        'Total_Phase_Consumption_kw': phase_total,
+        'P_consumption_kw': consumption
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, nargs='+', default=[30, 1000, 100000], help="Customer counts to run")
+    parser.add_argument('--timesteps', type=int, default=96, help="Training (and test) timesteps per customer")
+    parser.add_argument('--sklearn-max', type=int, default=1000, help="Largest customer count run through sklearn")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"--- Detector benchmark ({args.timesteps} train + {args.timesteps} test timesteps per customer) ---")
+    for num_customers in args.customers:
+        train_df = make_feature_frame(num_customers, args.timesteps, rng)
+        test_df = make_feature_frame(num_customers, args.timesteps, rng)
+
+        start = time.perf_counter()
+        models_df = fit_customer_models(train_df)
+        results_df = score_customers(models_df, test_df)
+        batched_s = time.perf_counter() - start
+        line = f"{num_customers:>7} customers: batched {batched_s:8.3f} s"
+
+        if num_customers <= args.sklearn_max:
+            start = time.perf_counter()
+            models = fit_customer_models_sklearn(train_df)
+            sklearn_results_df = score_customers_sklearn(models, test_df)
+            sklearn_s = time.perf_counter() - start
+
+            coef_diff = (sklearn_models_to_frame(models) - models_df).abs().to_numpy().max()
+            score_diff = (sklearn_results_df.set_index('Customer_ID')['Anomaly_Score']
+                          - results_df.set_index('Customer_ID')['Anomaly_Score']).abs().max()
+            line += (f" | sklearn {sklearn_s:8.3f} s | speedup {sklearn_s / batched_s:7.1f}x"
+                     f" | max coef diff {coef_diff:.2e}, max score diff {score_diff:.2e}")
+        print(line)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Accuracy vs speed of the linearized power flow against Newton-Raphson.
+
+Both solvers run on the same synthetic load matrix; the linearized voltages are
+compared with the Newton-Raphson voltages at every timestamp. Run from the
+project root:
+    python -m benchmarks.bench_linear_solver --timesteps 2000
+"""
+import argparse
+import time
+import numpy as np
+
+from network_builder import create_egyptian_lv_network
+from simulation_runner import build_load_matrix, run_time_series_power_flow, run_linearized_power_flow
+from benchmarks.bench_power_flow import make_merged_df
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--timesteps', type=int, default=2000, help="Number of 15-minute timestamps to solve")
+    parser.add_argument('--samples', type=int, default=24, help="Timestamps validated with Newton-Raphson")
+    args = parser.parse_args()
+
+    net, topology_df = create_egyptian_lv_network(verbose=False)
+    timestamps, customer_ids, load_matrix_kw = build_load_matrix(make_merged_df(topology_df, args.timesteps))
+    bus_ids = topology_df.set_index('Customer_ID').loc[customer_ids, 'Bus_ID'].values
+
+    start = time.perf_counter()
+    newton_v, converged = run_time_series_power_flow(net, bus_ids, load_matrix_kw, show_progress=False)
+    newton_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    linear_v, sampled_error_v = run_linearized_power_flow(net, bus_ids, load_matrix_kw, num_samples=args.samples)
+    linear_s = time.perf_counter() - start
+
+    error_v = np.abs(linear_v - newton_v)[converged]
+    rounded_diff = (np.round(linear_v, 2) != np.round(newton_v, 2))[converged].mean()
+    print(f"\n--- Linearized power flow benchmark ({args.timesteps} timesteps, {len(customer_ids)} customers) ---")
+    print(f"Newton-Raphson: {args.timesteps / newton_s:10.1f} timesteps/s ({newton_s:.2f} s)")
+    print(f"Linearized:     {args.timesteps / linear_s:10.1f} timesteps/s ({linear_s:.2f} s, "
+          f"incl. linearization and {args.samples} validation solves)")
+    print(f"Speedup: {newton_s / linear_s:.1f}x")
+    print(f"Voltage error: max {error_v.max():.4f} V, mean {error_v.mean():.4f} V, "
+          f"p99 {np.percentile(error_v, 99):.4f} V (sampled estimate {sampled_error_v:.4f} V)")
+    print(f"Values differing after rounding to 0.01 V: {rounded_diff:.2%}")
+
+if __name__ == '__main__':
+    main()
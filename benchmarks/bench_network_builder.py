@@ -0,0 +1,62 @@
+"""
+Compares building networks one element at a time, with bulk element creation and
+loading them from the network cache.
+
+Run from the project root:
+    python -m benchmarks.bench_network_builder --customers 30 1000 10000
+"""
+import argparse
+import tempfile
+import time
+import pandapower as pp
+
+from network_builder import generate_topology, build_network, load_or_build_network
+
+def build_network_per_element(topology_df):
+    """One pp.create_bus/pp.create_line call per customer, as the original builder did."""
+    net = pp.create_empty_network()
+    hv_bus = pp.create_bus(net, vn_kv=11)
+    pp.create_ext_grid(net, bus=hv_bus)
+    lv_buses = {}
+    for transformer_id in topology_df['Transformer_ID'].unique():
+        lv_buses[transformer_id] = pp.create_bus(net, vn_kv=0.4)
+        pp.create_transformer_from_parameters(net, hv_bus=hv_bus, lv_bus=lv_buses[transformer_id], sn_mva=0.4,
+                                              vn_hv_kv=11, vn_lv_kv=0.4, vkr_percent=0.9, vk_percent=4,
+                                              pfe_kw=0.7, i0_percent=0.18)
+    for transformer_id in topology_df['Transformer_ID'].values:
+        customer_bus = pp.create_bus(net, vn_kv=0.4)
+        pp.create_line(net, from_bus=lv_buses[transformer_id], to_bus=customer_bus, length_km=0.005,
+                       std_type="NAYY 4x50 SE")
+    return net
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, nargs='+', default=[30, 1000, 10000],
+                        help="Customer counts to build (200 customers per transformer above 30)")
+    args = parser.parse_args()
+
+    print("--- Network builder benchmark ---")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for num_customers in args.customers:
+            per_transformer = min(num_customers, 200)
+            config = {'transformers': max(num_customers // per_transformer, 1), 'customers_per_feeder': per_transformer}
+            topology_df = generate_topology(config)
+
+            start = time.perf_counter()
+            build_network_per_element(topology_df)
+            loop_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            build_network(topology_df, config)
+            bulk_s = time.perf_counter() - start
+
+            load_or_build_network(config, cache_dir=cache_dir, verbose=False)
+            start = time.perf_counter()
+            load_or_build_network(config, cache_dir=cache_dir, verbose=False)
+            cached_s = time.perf_counter() - start
+
+            print(f"{len(topology_df):>7} customers: per element {loop_s:8.3f} s | bulk {bulk_s:8.3f} s "
+                  f"({loop_s / bulk_s:6.1f}x) | cached load {cached_s * 1000:7.1f} ms")
+
+if __name__ == '__main__':
+    main()
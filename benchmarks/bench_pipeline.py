@@ -0,0 +1,166 @@
+"""
+End-to-end scaling and accuracy benchmark of the pipeline: consumption generation,
+power flow simulation with theft injection, detection and the dashboard's detection
+API, at configurable customer counts and durations.
+
+Every stage runs in its own process in a temporary directory, so its wall time and
+peak RSS are measured on their own. Detection results are also scored against the
+Is_Theft labels: precision@k, ROC AUC and the rank of every thief. One JSON record
+per stage is appended to --output (JSON Lines) with the git revision, and each stage
+is compared with the latest earlier record of the same stage and scale in that file.
+Run from the project root:
+    python -m benchmarks.bench_pipeline --customers 30 300 --days 28 --solver linear
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import numpy as np
+import pandas as pd
+from sklearn.metrics import roc_auc_score
+
+from detector import TEST_START
+from storage import read_dataset
+from theft_scenarios import random_scenarios
+from benchmarks.bench_sharded_detection import PROJECT_ROOT, run_mode
+
+DETECTORS = {
+    'batch': "from detector import train_and_detect; train_and_detect(use_cache=False)",
+    'sharded': "from detector import run_sharded_detection; run_sharded_detection(workers={workers})",
+    'streaming': "from detector import run_streaming_detection; run_streaming_detection()",
+}
+
+# The dashboard's first click runs a full incremental cycle; later clicks on unchanged data reuse it
+APP_SETUP = "from detection_api import DetectionAPI; api = DetectionAPI()"
+APP_CALLS = {'cold': APP_SETUP, 'warm': APP_SETUP + "; api.get_results()"}
+
+def git_revision():
+    """Short hash of the checked-out commit, or None outside a git checkout."""
+    process = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True, text=True)
+    return process.stdout.strip() or None
+
+def network_config(num_customers, customers_per_transformer):
+    """Network config with num_customers rounded down to whole transformers."""
+    per_transformer = min(num_customers, customers_per_transformer)
+    return {'transformers': max(num_customers // per_transformer, 1), 'customers_per_feeder': per_transformer}
+
+def ranking_metrics(results_df, theft_labels, k_values):
+    """
+    Scores a detection ranking (lowest Anomaly_Score first) against per-customer theft
+    labels: precision@k for every k and for k = number of thieves, ROC AUC and the
+    1-based rank of every thief. Thieves missing from the results count as missed.
+    """
+    results_df = results_df.sort_values('Anomaly_Score', kind='stable')
+    is_thief = theft_labels.reindex(results_df['Customer_ID'], fill_value=0).to_numpy() > 0
+    num_thieves = int((theft_labels > 0).sum())
+    metrics = {'num_thieves': num_thieves,
+               'precision_at_k': {str(k): float(is_thief[:k].sum() / min(k, len(is_thief))) for k in k_values}}
+    metrics['precision_at_thieves'] = float(is_thief[:num_thieves].sum() / num_thieves) if num_thieves else None
+    # Lower scores are more suspicious
+    has_both = 0 < is_thief.sum() < len(is_thief)
+    metrics['auc'] = float(roc_auc_score(is_thief, -results_df['Anomaly_Score'])) if has_both else None
+    metrics['thief_ranks'] = (np.flatnonzero(is_thief) + 1).tolist()
+    return metrics
+
+def load_records(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def previous_record(records, record):
+    """Latest earlier record of the same stage, mode and scale."""
+    key = ('stage', 'mode', 'customers', 'days')
+    matches = [r for r in records if all(r.get(k) == record[k] for k in key)]
+    return matches[-1] if matches else None
+
+def stage_codes(args, num_customers, start, end):
+    """Yields (stage, mode, setup, code) for every benchmarked stage in pipeline order."""
+    yield ('generate', 'month', '', "from data_generator import generate_and_save_load_profiles; "
+           f"generate_and_save_load_profiles({num_customers}, '{start}', '{end}')")
+    yield ('simulate', args.solver, '', "import pandas as pd; from network_builder import load_network_config; "
+           "from simulation_runner import run_full_simulation; "
+           f"run_full_simulation(workers={args.workers}, solver='{args.solver}', "
+           "network_config=load_network_config('network_config.json'), scenarios_df=pd.read_csv('scenarios.csv'))")
+    for detector in args.detectors:
+        yield ('detect', detector, '', DETECTORS[detector].format(workers=args.workers))
+    for mode, setup in APP_CALLS.items():
+        yield ('app', mode, setup, "api.get_results()")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, nargs='+', default=[30, 300], help="Customer counts to run")
+    parser.add_argument('--days', type=int, nargs='+', default=[28],
+                        help="Durations in days, centred on the detector's TEST_START")
+    parser.add_argument('--customers-per-transformer', type=int, default=150, help="Customers per transformer")
+    parser.add_argument('--theft-share', type=float, default=0.05, help="Share of customers given a random theft scenario")
+    parser.add_argument('--solver', choices=['newton', 'linear'], default='newton', help="Power flow solver")
+    parser.add_argument('--detectors', nargs='+', choices=list(DETECTORS), default=list(DETECTORS),
+                        help="Detection modes to run")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes for simulation and sharded detection; peak RSS is only measured "
+                             "for the main process")
+    parser.add_argument('--k', type=int, nargs='+', default=[5, 10], help="Ranks at which precision is reported")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the theft scenarios")
+    parser.add_argument('--output', default=os.path.join(PROJECT_ROOT, 'bench_pipeline_results.jsonl'),
+                        help="JSON Lines file the results are appended to")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    records = load_records(output)
+    run_info = {'run_at': datetime.datetime.now().isoformat(timespec='seconds'), 'revision': git_revision(),
+                'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+    print(f"--- Pipeline benchmark (revision {run_info['revision']}, solver={args.solver}) ---")
+    for requested_customers in args.customers:
+        config = network_config(requested_customers, args.customers_per_transformer)
+        num_customers = config['transformers'] * config['customers_per_feeder']
+        num_thieves = max(1, round(num_customers * args.theft_share))
+        for days in args.days:
+            start = TEST_START - pd.Timedelta(days=days // 2)
+            end = start + pd.Timedelta(days=days) - pd.Timedelta(minutes=15)
+            num_timesteps = days * 96
+            num_records = num_customers * num_timesteps
+
+            with tempfile.TemporaryDirectory() as workdir:
+                os.chdir(workdir)
+                with open('network_config.json', 'w') as f:
+                    json.dump(config, f)
+                scenarios_df = random_scenarios(np.arange(1, num_customers + 1), num_thieves, TEST_START, args.seed)
+                scenarios_df.to_csv('scenarios.csv', index=False)
+
+                for stage, mode, setup, code in stage_codes(args, num_customers, start, end):
+                    seconds, peak_mb, returncode = run_mode(code, workdir, setup)
+                    record = dict(run_info, stage=stage, mode=mode, customers=num_customers, days=days,
+                                  timesteps=num_timesteps, records=num_records, seconds=seconds, peak_rss_mb=peak_mb,
+                                  records_per_s=num_records / seconds, timesteps_per_s=num_timesteps / seconds,
+                                  customers_per_s=num_customers / seconds, returncode=returncode)
+                    line = (f"{num_customers:>6} customers, {days:>3} days | {stage:>8} {mode:<9} {seconds:8.2f} s, "
+                            f"{peak_mb:7.1f} MB, {record['records_per_s']:>12,.0f} records/s")
+                    if returncode:
+                        line += f" | EXIT CODE {returncode}"
+
+                    if stage == 'detect':
+                        theft_labels = read_dataset('final_dataset_with_theft', columns=['Customer_ID', 'Is_Theft']) \
+                            .groupby('Customer_ID')['Is_Theft'].max()
+                        record.update(ranking_metrics(read_dataset('anomaly_results'), theft_labels, args.k))
+                        auc = 'n/a' if record['auc'] is None else f"{record['auc']:.3f}"
+                        precision = ', '.join(f"P@{k} {p:.2f}" for k, p in record['precision_at_k'].items())
+                        line += f" | {precision}, AUC {auc}, thieves at ranks {record['thief_ranks'][:10]}"
+
+                    previous = previous_record(records, record)
+                    if previous is not None:
+                        line += (f" | vs {previous['revision']}: time x{seconds / previous['seconds']:.2f}, "
+                                 f"memory x{peak_mb / previous['peak_rss_mb']:.2f}")
+                    print(line)
+                    records.append(record)
+                    with open(output, 'a') as f:
+                        f.write(json.dumps(record) + '\n')
+                os.chdir(PROJECT_ROOT)
+    print(f"Results appended to {output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Compares the legacy per-timestamp power flow loop against the time-series engine.
+
+Run from the project root:
+    python -m benchmarks.bench_power_flow --timesteps 200 --workers 4
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from network_builder import create_egyptian_lv_network
+from simulation_runner import (run_legacy_power_flow, build_load_matrix, run_time_series_power_flow,
+                               run_parallel_power_flow, time_series_results_to_frame)
+
+def make_merged_df(topology_df, num_timesteps, seed=42):
+    """Builds a synthetic (timestamp x customer) consumption slice merged with the topology."""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range('2023-01-01', periods=num_timesteps, freq='15min')
+    num_customers = len(topology_df)
+    return pd.DataFrame({
+        'Timestamp': np.repeat(timestamps, num_customers),
+        'Customer_ID': np.tile(topology_df['Customer_ID'].values, num_timesteps),
+        'P_consumption_kw': np.round(rng.uniform(0.05, 3.0, num_timesteps * num_customers), 4),
+        'Bus_ID': np.tile(topology_df['Bus_ID'].values, num_timesteps),
+        'Phase': np.tile(topology_df['Phase'].values, num_timesteps),
+        'Transformer_ID': np.tile(topology_df['Transformer_ID'].values, num_timesteps)
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--timesteps', type=int, default=200, help="Number of 15-minute timestamps to solve")
+    parser.add_argument('--workers', type=int, default=0, help="Also benchmark the parallel engine with N workers")
+    parser.add_argument('--chunk-size', type=int, default=96, help="Timestamps per chunk for the parallel engine")
+    args = parser.parse_args()
+
+    net, topology_df = create_egyptian_lv_network()
+    merged_df = make_merged_df(topology_df, args.timesteps)
+
+    start = time.perf_counter()
+    legacy_df = run_legacy_power_flow(net, merged_df)
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    timestamps, customer_ids, load_matrix_kw = build_load_matrix(merged_df)
+    ordered_topology = topology_df.set_index('Customer_ID').loc[customer_ids].reset_index()
+    voltages_v, converged = run_time_series_power_flow(net, ordered_topology['Bus_ID'].values, load_matrix_kw)
+    series_df = time_series_results_to_frame(timestamps, ordered_topology, load_matrix_kw, voltages_v, converged)
+    series_s = time.perf_counter() - start
+
+    max_diff = (legacy_df['Voltage_V'] - series_df['Voltage_V']).abs().max()
+    print(f"\n--- Power flow benchmark ({args.timesteps} timesteps, {len(topology_df)} customers) ---")
+    print(f"Legacy loop:        {args.timesteps / legacy_s:8.1f} timesteps/s ({legacy_s:.2f} s)")
+    print(f"Time-series engine: {args.timesteps / series_s:8.1f} timesteps/s ({series_s:.2f} s)")
+    print(f"Speedup: {legacy_s / series_s:.1f}x, max voltage difference: {max_diff:.4f} V")
+
+    if args.workers > 1:
+        bus_ids = ordered_topology['Bus_ID'].values
+        serial_v, serial_ok = run_time_series_power_flow(net, bus_ids, load_matrix_kw, restart_every=args.chunk_size,
+                                                         show_progress=False)
+        start = time.perf_counter()
+        parallel_v, parallel_ok = run_parallel_power_flow(bus_ids, load_matrix_kw, args.workers, args.chunk_size)
+        parallel_s = time.perf_counter() - start
+        identical = np.array_equal(serial_v, parallel_v, equal_nan=True) and np.array_equal(serial_ok, parallel_ok)
+        print(f"Parallel engine ({args.workers} workers): {args.timesteps / parallel_s:8.1f} timesteps/s "
+              f"({parallel_s:.2f} s), identical to serial: {identical}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Load test for the real-time scoring service: sends micro-batches over the socket
+endpoint and reports per-batch latency (p50/p99) and readings per second.
+The service runs in a background thread of this process, on a single core.
+
+Run from the project root:
+    python -m benchmarks.bench_scoring_service --customers 1000 --batches 500
+"""
+import argparse
+import asyncio
+import json
+import socket
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from detector import FEATURES
+from scoring_service import StreamingScorer, serve
+
+def make_models(num_customers, rng):
+    """Builds synthetic per-customer models and shard labels (one transformer, three phases)."""
+    customer_ids = pd.Index(np.arange(1, num_customers + 1), name='Customer_ID')
+    models_df = pd.DataFrame({
+        'Intercept': rng.normal(0, 1, num_customers),
+        FEATURES[0]: rng.normal(0, 0.01, num_customers),
+        FEATURES[1]: rng.normal(0.03, 0.01, num_customers),
+    }, index=customer_ids)
+    shards = pd.Series(rng.choice(['A', 'B', 'C'], num_customers), index=customer_ids)
+    return models_df, shards
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, default=1000, help="Number of customers")
+    parser.add_argument('--batches', type=int, default=500, help="Number of micro-batches (one timestamp each)")
+    parser.add_argument('--port', type=int, default=8766, help="Port for the benchmark service")
+    parser.add_argument('--threshold', type=float, default=-1e9,
+                        help="Alert threshold; the synthetic readings do not follow the models, so alerts are off by default")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    models_df, shards = make_models(args.customers, rng)
+    scorer = StreamingScorer(models_df, shards, args.threshold)
+    threading.Thread(target=lambda: asyncio.run(serve(scorer, port=args.port)), daemon=True).start()
+    time.sleep(0.5)
+
+    # Pre-encode the requests so the client side is not measured
+    timestamps = pd.date_range('2023-03-01', periods=args.batches, freq='15min').astype(str)
+    customer_ids = models_df.index.tolist()
+    requests = []
+    for timestamp in timestamps:
+        kw = rng.uniform(0.05, 3.0, args.customers).round(4).tolist()
+        volts = rng.normal(399, 0.3, args.customers).round(2).tolist()
+        readings = [[timestamp, cid, p, v] for cid, p, v in zip(customer_ids, kw, volts)]
+        requests.append((json.dumps({'readings': readings}) + '\n').encode())
+
+    latencies = []
+    with socket.create_connection(('127.0.0.1', args.port)) as sock:
+        responses = sock.makefile('rb')
+        start = time.perf_counter()
+        for request in requests:
+            t0 = time.perf_counter()
+            sock.sendall(request)
+            responses.readline()
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    print(f"--- Scoring service load test ({args.batches} batches x {args.customers} readings) ---")
+    print(f"Per-batch latency: p50 {np.percentile(latencies_ms, 50):.2f} ms, p99 {np.percentile(latencies_ms, 99):.2f} ms")
+    print(f"Throughput: {args.batches * args.customers / elapsed:,.0f} readings/s")
+
+if __name__ == '__main__':
+    main()
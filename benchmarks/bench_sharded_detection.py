@@ -0,0 +1,112 @@
+"""
+Compares peak memory and wall time of whole-dataset detection (train_and_detect)
+against sharded detection (run_sharded_detection) on a synthetic multi-transformer
+dataset, and checks that both produce the same scores.
+
+Each mode runs in its own process in a temporary directory so its peak RSS is
+measured on its own. Run from the project root:
+    python -m benchmarks.bench_sharded_detection --transformers 20 --customers-per-transformer 150
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+from data_generator import create_daily_profiles, generate_consumption_matrix
+from detector import TEST_START
+from storage import write_dataset, read_dataset
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'whole dataset': "from detector import train_and_detect; train_and_detect(use_cache=False)",
+    'sharded': "from detector import run_sharded_detection; run_sharded_detection(workers={workers})",
+}
+
+def write_synthetic_dataset(num_transformers, customers_per_transformer, days, seed=42):
+    """
+    Writes a synthetic final_dataset_with_theft to the current directory. Voltages
+    drop with the load on the customer's transformer phase; one customer per
+    transformer under-reports by 90% from TEST_START. Returns the number of rows.
+    """
+    rng = np.random.default_rng(seed)
+    num_customers = num_transformers * customers_per_transformer
+    customer_ids = np.arange(1, num_customers + 1)
+    transformer_ids = (customer_ids - 1) // customers_per_transformer + 1
+    phase_codes = (customer_ids - 1) % 3
+    thieves = (transformer_ids - 1) * customers_per_transformer + 5
+
+    timestamps = pd.date_range(TEST_START - pd.Timedelta(days=days // 2), periods=days * 96, freq='15min')
+    consumption = generate_consumption_matrix(timestamps, create_daily_profiles(num_customers, rng), rng)
+    shard_codes = (transformer_ids - 1) * 3 + phase_codes
+    shard_load = np.stack([np.bincount(shard_codes, weights=row) for row in consumption])[:, shard_codes]
+    voltage = 400 - 0.01 * shard_load - 0.2 * consumption + rng.normal(0, 0.05, consumption.shape)
+
+    is_theft = (timestamps >= TEST_START)[:, None] & np.isin(customer_ids, thieves)[None, :]
+    reported = np.where(is_theft, consumption * 0.1, consumption)
+    df = pd.DataFrame({
+        'Timestamp': np.repeat(timestamps, num_customers),
+        'Customer_ID': np.tile(customer_ids, len(timestamps)),
+        'Phase': np.tile(np.array(['A', 'B', 'C'])[phase_codes], len(timestamps)),
+        'Transformer_ID': np.tile(transformer_ids, len(timestamps)),
+        'P_consumption_kw': reported.ravel(),
+        'Voltage_V': np.round(voltage, 2).ravel(),
+        'Is_Theft': is_theft.ravel().astype(np.int8),
+    })
+    write_dataset(df, 'final_dataset_with_theft')
+    return len(df)
+
+# Peak RSS of the running process image. ru_maxrss survives exec on Linux, so a
+# child would report the (larger) peak of the benchmark process that spawned it
+PEAK_RSS_MB = ("next(int(line.split()[1]) for line in open('/proc/self/status') "
+               "if line.startswith('VmHWM')) / 1024")
+
+def run_mode(code, cwd, setup=''):
+    """
+    Runs one detection mode in a fresh process; returns (wall seconds, peak RSS in MB,
+    exit code). setup runs first and is not timed, but counts towards the peak RSS.
+    A process that exits with an error after printing its measurement still returns
+    it, but the exit code and the end of its stderr are printed so the crash is seen.
+    """
+    script = (f"import sys, time; sys.path.insert(0, {PROJECT_ROOT!r}); {setup or 'pass'}; start = time.perf_counter(); "
+              f"{code}; print('BENCH', time.perf_counter() - start, {PEAK_RSS_MB}, flush=True)")
+    process = subprocess.run([sys.executable, '-c', script], cwd=cwd, capture_output=True, text=True)
+    if 'BENCH' not in process.stdout:
+        raise subprocess.CalledProcessError(process.returncode, process.args, process.stdout, process.stderr)
+    if process.returncode:
+        print(f"WARNING: benchmark process exited with code {process.returncode} after its measurement; "
+              f"stderr ends with:\n{process.stderr[-2000:]}")
+    seconds, peak_mb = process.stdout.rsplit('BENCH', 1)[1].split()
+    return float(seconds), float(peak_mb), process.returncode
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--transformers', type=int, default=20, help="Number of transformers")
+    parser.add_argument('--customers-per-transformer', type=int, default=150, help="Customers per transformer")
+    parser.add_argument('--days', type=int, default=28, help="Days of readings (half training, half testing)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes for sharded detection; peak RSS is only measured for the main process")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        num_rows = write_synthetic_dataset(args.transformers, args.customers_per_transformer, args.days)
+        print(f"--- Sharded detection benchmark ({num_rows:,} readings, {args.transformers} transformers x "
+              f"{args.customers_per_transformer} customers) ---")
+
+        scores = {}
+        for mode, code in MODES.items():
+            seconds, peak_mb, returncode = run_mode(code.format(workers=args.workers), workdir)
+            scores[mode] = read_dataset('anomaly_results').set_index('Customer_ID')['Anomaly_Score'].sort_index()
+            print(f"{mode:>14}: {seconds:7.2f} s, peak RSS {peak_mb:8.1f} MB"
+                  + (f" (exit code {returncode})" if returncode else ""))
+        os.chdir(PROJECT_ROOT)
+
+    max_diff = (scores['whole dataset'] - scores['sharded']).abs().max()
+    print(f"Max score difference: {max_diff:.2e}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Startup time of the unified CLI and time-to-first-request of the dashboard.
+
+1. For every cli.py command, the time until `--help` is printed (imports included)
+   and the heavy libraries it loaded, against importing every pipeline module up
+   front as a monolithic CLI would.
+2. For `cli.py serve` with and without pre-warming detection, the time until the
+   web interface answers and the time until the first detection request returns,
+   both measured from process start. Each server runs in a fresh directory linked
+   to the project's final dataset, so its first detection cycle starts cold.
+
+Run from the project root after generating the dataset:
+    python -m benchmarks.bench_startup --repeats 3
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import numpy as np
+
+from cli import COMMANDS
+from storage import dataset_path, resolve_format
+from benchmarks.bench_sharded_detection import PROJECT_ROOT
+
+HEAVY_MODULES = ['pandas', 'pyarrow', 'sklearn', 'pandapower', 'gradio']
+EAGER_IMPORTS = "import data_generator, network_builder, simulation_runner, theft_scenarios, detector, scoring_service, app, gradio"
+# Prints a command's help, as `python cli.py <command> --help` does, without its output
+HELP_CODE = """import cli, contextlib, io
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        cli.main([{command!r}, '--help'])
+    except SystemExit:
+        pass"""
+
+def time_startup(code, repeats):
+    """Median wall time of running code in a fresh interpreter, and the heavy modules it loaded."""
+    script = (f"import sys, time\nstart = time.perf_counter()\nsys.path.insert(0, {PROJECT_ROOT!r})\n{code}\n"
+              f"print('BENCH', time.perf_counter() - start, *[m for m in {HEAVY_MODULES!r} if m in sys.modules])")
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=PROJECT_ROOT).stdout
+        seconds, *modules = output.rsplit('BENCH', 1)[1].split()
+        runs.append(float(seconds))
+    return float(np.median(runs)), modules
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def time_first_request(prewarm, timeout=120):
+    """Starts the dashboard in a fresh directory; returns (seconds to UI, seconds to first detection result)."""
+    from gradio_client import Client
+
+    dataset = dataset_path('final_dataset_with_theft', resolve_format('final_dataset_with_theft'))
+    with tempfile.TemporaryDirectory() as workdir:
+        os.symlink(os.path.join(PROJECT_ROOT, dataset), os.path.join(workdir, dataset))
+        port = free_port()
+        url = f"http://127.0.0.1:{port}/"
+        command = [sys.executable, os.path.join(PROJECT_ROOT, 'cli.py'), 'serve', '--port', str(port)]
+        if not prewarm:
+            command.append('--no-prewarm')
+        start = time.perf_counter()
+        server = subprocess.Popen(command, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                  env=dict(os.environ, GRADIO_ANALYTICS_ENABLED='False'))
+        try:
+            while True:
+                try:
+                    urllib.request.urlopen(url, timeout=1)
+                    break
+                except OSError:
+                    if time.perf_counter() - start > timeout or server.poll() is not None:
+                        raise RuntimeError("The dashboard did not start")
+                    time.sleep(0.05)
+            ready_s = time.perf_counter() - start
+
+            # The client's own handshake is not part of the request
+            client = Client(url, verbose=False)
+            request_start = time.perf_counter()
+            client.predict(api_name='/simulate_agent_run')
+            request_s = time.perf_counter() - request_start
+        finally:
+            server.terminate()
+            server.wait()
+    return ready_s, ready_s + request_s
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=3, help="Runs per measurement (the median is reported)")
+    parser.add_argument('--skip-serve', action='store_true', help="Only measure the CLI commands")
+    args = parser.parse_args()
+
+    print("--- CLI startup (median time to print --help) ---")
+    for command in COMMANDS:
+        seconds, modules = time_startup(HELP_CODE.format(command=command), args.repeats)
+        print(f"{command:>10}: {seconds:6.2f} s, loads {', '.join(modules) or '-'}")
+    seconds, modules = time_startup(EAGER_IMPORTS, args.repeats)
+    print(f"{'eager':>10}: {seconds:6.2f} s, loads {', '.join(modules)} (every module imported up front)")
+
+    if args.skip_serve:
+        return
+    print("--- Dashboard time-to-first-request (median, from process start) ---")
+    for prewarm in (False, True):
+        runs = np.array([time_first_request(prewarm) for _ in range(args.repeats)])
+        ready_s, first_s = np.median(runs, axis=0)
+        label = 'pre-warmed' if prewarm else 'no pre-warm'
+        print(f"{label:>12}: UI ready {ready_s:6.2f} s | first detection result {first_s:6.2f} s "
+              f"(request took {(first_s - ready_s) * 1000:7.1f} ms)")
+
+if __name__ == '__main__':
+    main()
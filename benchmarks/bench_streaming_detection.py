@@ -0,0 +1,52 @@
+"""
+Peak memory of whole-dataset detection (train_and_detect) against out-of-core
+streaming detection (run_streaming_detection) as the dataset grows.
+
+For each duration a synthetic dataset is written to a temporary directory and both
+modes run in their own process. Run from the project root:
+    python -m benchmarks.bench_streaming_detection --days 14 28 56
+"""
+import argparse
+import os
+import tempfile
+
+from storage import read_dataset
+from benchmarks.bench_sharded_detection import PROJECT_ROOT, write_synthetic_dataset, run_mode
+
+MODES = {
+    'whole dataset': "from detector import train_and_detect; train_and_detect(use_cache=False)",
+    'streaming': "from detector import run_streaming_detection; run_streaming_detection(chunk='{chunk}')",
+}
+
+def directory_size_mb(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files) / 2 ** 20
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, nargs='+', default=[14, 28, 56], help="Dataset durations in days")
+    parser.add_argument('--transformers', type=int, default=10, help="Number of transformers")
+    parser.add_argument('--customers-per-transformer', type=int, default=150, help="Customers per transformer")
+    parser.add_argument('--chunk', default='1D', help="Chunk length of the streaming mode")
+    args = parser.parse_args()
+
+    print(f"--- Streaming detection memory benchmark ({args.transformers * args.customers_per_transformer} customers, "
+          f"{args.chunk} chunks) ---")
+    for days in args.days:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            num_rows = write_synthetic_dataset(args.transformers, args.customers_per_transformer, days)
+            line = (f"{days:>4} days, {num_rows:>11,} readings, "
+                    f"{directory_size_mb('final_dataset_with_theft.parquet'):7.1f} MB on disk:")
+            scores = {}
+            for mode, code in MODES.items():
+                seconds, peak_mb, returncode = run_mode(code.format(chunk=args.chunk), workdir)
+                scores[mode] = read_dataset('anomaly_results').set_index('Customer_ID')['Anomaly_Score'].sort_index()
+                line += f" | {mode} {peak_mb:7.1f} MB peak, {seconds:6.2f} s"
+                if returncode:
+                    line += f" (exit code {returncode})"
+            os.chdir(PROJECT_ROOT)
+        max_diff = (scores['whole dataset'] - scores['streaming']).abs().max()
+        print(line + f" | max score diff {max_diff:.1e}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import html
+import math
+from functools import lru_cache
+from string import Template
+import numpy as np
+from storage import read_dataset, read_distinct
+from model_store import dataset_fingerprint
+
+DATASET = 'final_dataset_with_theft'
+
+# Severity levels, most severe first: (key, Arabic label, colour, upper bound of the robust z-score).
+# Scores are sums of residuals over the testing period, so their scale grows with the data; the
+# z-score (distance from the median score in units of the scaled MAD) does not.
+SEVERITY_LEVELS = [
+    ('very_high', "مرتفع جدًا", "#e74c3c", -50.0),
+    ('high', "مرتفع", "#e67e22", -10.0),
+    ('medium', "متوسط", "#f1c40f", -3.5),
+    ('low', "منخفض", "#95a5a6", math.inf),
+]
+SEVERITY_LABELS = {key: label for key, label, _, _ in SEVERITY_LEVELS}
+SEVERITY_COLOURS = {key: colour for key, _, colour, _ in SEVERITY_LEVELS}
+
+# Points per series sent to the dashboard's plots
+SERIES_POINTS = 500
+
+DIAGNOSES = {
+    'urgent': """
+                    <p style='font-weight: 600; color:#2c3e50; margin-top:0;'>تشخيص الذكاء الاصطناعي:</p>
+                    <ul style='padding-right: 20px; margin-top: 5px; margin-bottom: 15px;'>
+                        <li>تم رصد هبوط ملحوظ في الجهد لا يتناسب مع الاستهلاك المنخفض المسجل.</li>
+                        <li>يشير ذلك باحتمالية عالية لوجود حمل غير مقاس (سرقة).</li>
+                    </ul>
+                    <p style='font-weight: 600; color:#2c3e50;'>الإجراء الموصى به:</p>
+                     <ul style='padding-right: 20px; margin-top: 5px; margin-bottom: 0;'>
+                        <li><strong>أولوية قصوى:</strong> إرسال فريق التفتيش للتحقق المادي الفوري.</li>
+                    </ul>
+                """,
+    'watch': """
+                    <p style='font-weight: 600; color:#2c3e50; margin-top:0;'>تشخيص الذكاء الاصطناعي:</p>
+                    <ul style='padding-right: 20px; margin-top: 5px; margin-bottom: 15px;'>
+                        <li>تم رصد تناقض طفيف بين قراءات الجهد والاستهلاك.</li>
+                    </ul>
+                    <p style='font-weight: 600; color:#2c3e50;'>الإجراء الموصى به:</p>
+                     <ul style='padding-right: 20px; margin-top: 5px; margin-bottom: 0;'>
+                        <li>إضافة العميل لقائمة المراقبة والتحقق الدوري.</li>
+                    </ul>
+                """,
+}
+
+CASE_CARD_TEMPLATE = Template("""
+            <div style='border: 1px solid #ecf0f1; border-right: 7px solid $colour; padding: 20px; margin-bottom: 20px; border-radius: 10px; background-color: #ffffff; box-shadow: 0 4px 8px rgba(0,0,0,0.05); font-family: Cairo, sans-serif;'>
+                <h3 style='color: #34495e; margin-top:0; text-align:center;'>ملف قضية: العميل رقم $customer_id</h3>
+                <hr style='border-top: 1px solid #ecf0f1;'>
+                <p style='font-size: 1.2em; font-weight: bold;'>درجة الشبهة: <span style='color: $colour;'>$score</span> (خطورة: $severity)</p>
+                <p style='color:#7f8c8d;'><strong>المحول:</strong> $transformer_id، <strong>الطور:</strong> $phase</p>
+                <p style='color:#7f8c8d;'><strong>العنوان (مثال):</strong> $address شارع المحطة، القاهرة</p>
+                <div style='background-color: #f8f9f9; padding:15px; border-radius:8px; margin-top:15px;'>
+                    $diagnosis
+                </div>
+            </div>
+            """)
+
+PAGE_TEMPLATE = Template("""<div style='direction: rtl;'>
+            <p style='text-align:center; color:#7f8c8d; font-family: Cairo, sans-serif;'>القضايا $first–$last من $matches (إجمالي العملاء: $total)</p>
+            $cards
+        </div>""")
+
+EMPTY_PAGE_HTML = ("<div style='text-align:center; padding: 20px; color:#95a5a6; font-family: Cairo, sans-serif;'>"
+                   "لا توجد حالات تطابق المرشحات المحددة.</div>")
+
+def assign_severity(scores, levels=SEVERITY_LEVELS):
+    """
+    Classifies anomaly scores into severity keys by their robust z-score against all
+    customers. Returns (severity keys, z-scores).
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    median = np.median(scores)
+    scale = 1.4826 * np.median(np.abs(scores - median))
+    if not scale > 0:
+        scale = scores.std() or 1.0
+    z = (scores - median) / scale
+    bounds = [bound for _, _, _, bound in levels]
+    # First level whose bound is above the z-score
+    codes = np.searchsorted(bounds, z, side='right')
+    return np.array([key for key, _, _, _ in levels])[np.minimum(codes, len(levels) - 1)], z
+
+@lru_cache(maxsize=65536)
+def render_case_card(customer_id, score, severity, transformer_id, phase):
+    """
+    Renders one case card. The arguments are everything the card shows, so a card is
+    only rebuilt when the customer's score (its version) or severity changes.
+    """
+    return CASE_CARD_TEMPLATE.substitute(
+        colour=SEVERITY_COLOURS[severity], customer_id=customer_id, score=f"{score:.2f}",
+        severity=SEVERITY_LABELS[severity], transformer_id=transformer_id, phase=html.escape(str(phase)),
+        address=100 + customer_id, diagnosis=DIAGNOSES['urgent' if severity == 'very_high' else 'watch'])
+
+@lru_cache(maxsize=8)
+def customer_locations(fingerprint):
+    """Transformer and phase of every customer in the dataset version identified by fingerprint."""
+    return read_distinct(DATASET, ['Customer_ID', 'Transformer_ID', 'Phase']).set_index('Customer_ID')
+
+@lru_cache(maxsize=256)
+def customer_series(customer_id, transformer_id, phase, fingerprint, max_points=SERIES_POINTS):
+    """
+    Reads one customer's readings (only its transformer/phase partitions) and
+    downsamples them to at most max_points time buckets, averaging each bucket.
+    Returns a frame with Timestamp, P_consumption_kw and Voltage_V.
+    """
+    df = read_dataset(DATASET, columns=['Timestamp', 'Customer_ID', 'P_consumption_kw', 'Voltage_V'],
+                      phases=[phase], transformers=[transformer_id])
+    df = df[df['Customer_ID'] == customer_id]
+    bucket = np.arange(len(df)) // max(math.ceil(len(df) / max_points), 1)
+    return df.groupby(bucket).agg({'Timestamp': 'first', 'P_consumption_kw': 'mean', 'Voltage_V': 'mean'}) \
+        .reset_index(drop=True)
+
+class CaseReport:
+    """
+    Case files of the latest detection ranking. update() classifies every customer
+    once per ranking; page() filters by severity and phase and renders one page of
+    cards on the server, reusing the cached cards of customers whose score did not
+    change. Readings behind a case are only read when series() is asked for them.
+    """
+
+    def __init__(self):
+        self.cases = None
+        self._fingerprint = None
+
+    def update(self, results_df):
+        """
+        Builds the case table from a ranking (Customer_ID, Anomaly_Score, optionally
+        Transformer_ID and Phase) and returns the number of cases per severity.
+        """
+        self._fingerprint = dataset_fingerprint(DATASET)
+        cases = results_df[['Customer_ID', 'Anomaly_Score']].copy()
+        if {'Transformer_ID', 'Phase'} <= set(results_df.columns):
+            cases[['Transformer_ID', 'Phase']] = results_df[['Transformer_ID', 'Phase']]
+        else:
+            locations = customer_locations(self._fingerprint).reindex(cases['Customer_ID'])
+            cases['Transformer_ID'] = locations['Transformer_ID'].to_numpy()
+            cases['Phase'] = locations['Phase'].astype(str).to_numpy()
+        cases['Severity'], cases['Z_Score'] = assign_severity(cases['Anomaly_Score'])
+        self.cases = cases.sort_values('Anomaly_Score', kind='stable').reset_index(drop=True)
+        return self.cases['Severity'].value_counts().reindex(SEVERITY_LABELS, fill_value=0)
+
+    def page(self, page=1, severities=None, phases=None, page_size=10):
+        """
+        Renders one page of the cases matching the severities and phases (None = all).
+        Returns (html, page, number of pages, customer IDs on the page); page is
+        clamped to the available pages.
+        """
+        if self.cases is None:
+            return EMPTY_PAGE_HTML, 1, 1, []
+        mask = np.ones(len(self.cases), dtype=bool)
+        if severities:
+            mask &= self.cases['Severity'].isin(severities).to_numpy()
+        if phases:
+            mask &= self.cases['Phase'].isin(phases).to_numpy()
+        matches = self.cases[mask]
+        num_pages = max(math.ceil(len(matches) / page_size), 1)
+        page = min(max(int(page), 1), num_pages)
+        page_df = matches.iloc[(page - 1) * page_size:page * page_size]
+        if not len(page_df):
+            return EMPTY_PAGE_HTML, page, num_pages, []
+
+        cards = [render_case_card(int(case.Customer_ID), float(case.Anomaly_Score), case.Severity,
+                                  int(case.Transformer_ID), case.Phase) for case in page_df.itertuples(index=False)]
+        first = (page - 1) * page_size + 1
+        page_html = PAGE_TEMPLATE.substitute(first=first, last=first + len(page_df) - 1, matches=len(matches),
+                                             total=len(self.cases), cards=''.join(cards))
+        return page_html, page, num_pages, page_df['Customer_ID'].astype(int).tolist()
+
+    def series(self, customer_id, max_points=SERIES_POINTS):
+        """Downsampled consumption and voltage series of one case (cached per dataset version)."""
+        case = self.cases.loc[self.cases['Customer_ID'] == customer_id].iloc[0]
+        return customer_series(int(customer_id), int(case['Transformer_ID']), case['Phase'], self._fingerprint,
+                               max_points)
@@ -0,0 +1,30 @@
+import argparse
+import importlib
+
+# Subcommand -> (module, description). A module is only imported when its subcommand
+# runs, so e.g. `detect` never imports pandapower and `generate` never imports gradio.
+COMMANDS = {
+    'generate': ('data_generator', "Generate synthetic consumption data"),
+    'network': ('network_builder', "Build (or load from cache) the virtual distribution network"),
+    'simulate': ('simulation_runner', "Run the power flow simulation and inject theft scenarios"),
+    'scenarios': ('theft_scenarios', "Create a labelled dataset from the saved power flow results"),
+    'detect': ('detector', "Train per-customer models and detect anomalies"),
+    'score': ('scoring_service', "Real-time anomaly scoring service for incoming meter readings"),
+    'serve': ('app', "Start the web dashboard (detection is pre-warmed in the background)"),
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Electricity theft detection pipeline.",
+        epilog="commands:\n" + "\n".join(f"  {name:<10} {description}" for name, (_, description) in COMMANDS.items())
+               + "\n\nRun '%(prog)s <command> --help' for the options of a command.",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=COMMANDS, metavar='command', help="One of the commands below")
+    parser.add_argument('args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    module = importlib.import_module(COMMANDS[args.command][0])
+    module.main(args.args, prog=f"{parser.prog} {args.command}")
+
+if __name__ == '__main__':
+    main()
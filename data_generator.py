@@ -1,82 +1,150 @@
+import argparse
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from storage import write_dataset, read_dataset
+from instrumentation import run, stage
 
-def generate_and_save_load_profiles():
+# Each day has 96 profile slots (24 hours * 4 intervals/hour)
+SLOTS_PER_DAY = 96
+SLOT_MINUTES = 15
+
+def create_daily_profiles(num_customers, rng):
+    """
+    Creates one daily load profile (96 x 15-minute slots) per customer.
+    Returns a (num_customers x 96) matrix in kW.
+    """
+    # Morning peak (6 AM to 12 PM)
+    morning_peak = np.linspace(0.3, 1.5, 24)
+    # Afternoon lull (12 PM to 6 PM)
+    afternoon_lull = np.linspace(1.5, 0.4, 24)
+    # Evening peak (6 PM to 12 AM)
+    evening_peak = np.linspace(0.4, 2.5, 24)
+    # Night base load (12 AM to 6 AM)
+    night_base = np.linspace(2.5, 0.3, 24)
+
+    profile = np.concatenate([night_base, morning_peak, afternoon_lull, evening_peak])
+
+    # Add noise to make it more realistic
+    noise = rng.normal(0, 0.1, (num_customers, SLOTS_PER_DAY))
+    profiles = profile + noise
+
+    # Ensure no negative or extremely small values
+    return np.maximum(profiles, 0.05)
+
+def generate_consumption_matrix(timestamps, profiles, rng):
+    """
+    Builds the (timestamp x customer) consumption matrix in kW for the given
+    timestamps from the per-customer daily profiles, in one vectorized pass.
     """
-    This function generates realistic consumption data for 30 customers
-    over 3 months and saves it into a CSV file.
+    timestamps = pd.DatetimeIndex(timestamps)
+    time_index = (timestamps.hour * 60 + timestamps.minute) // SLOT_MINUTES
+    is_weekend = timestamps.weekday >= 4  # Friday and Saturday
+
+    # Get base consumption from each customer's profile
+    consumption = profiles[:, time_index].T
+
+    # Adjust consumption with random variation and weekend effect
+    consumption = consumption * (0.9 + 0.2 * rng.random(consumption.shape))
+    consumption[is_weekend] *= 1.2  # Slightly higher consumption on weekends
+
+    return np.round(consumption, 4)
+
+def matrix_to_records(timestamps, customer_ids, consumption):
+    """Flattens a (timestamp x customer) matrix into the long consumption_data.csv layout."""
+    return pd.DataFrame({
+        'Timestamp': np.repeat(np.asarray(timestamps), len(customer_ids)),
+        'Customer_ID': np.tile(customer_ids, len(timestamps)),
+        'P_consumption_kw': consumption.ravel()  # Power consumption in kW
+    })
+
+def iter_load_profile_chunks(num_customers=30, start='2023-01-01 00:00', end='2023-03-31 23:45',
+                             freq='15min', seed=42, chunk='month', customers_per_chunk=1000):
+    """
+    Yields the consumption records as DataFrames, one chunk at a time, so only one
+    chunk is ever held in memory.
+
+    chunk='month' yields one calendar month for all customers, chunk='customers'
+    yields the full period for customers_per_chunk customers, and chunk=None yields
+    everything at once. The random stream is consumed in chunk order, so a seed
+    reproduces the same data for the same chunk layout ('month' and None match).
     """
+    rng = np.random.default_rng(seed)
+    date_range = pd.date_range(start=start, end=end, freq=freq)
+    customer_ids = np.arange(1, num_customers + 1)
+
+    # Pre-generate a unique profile for each customer
+    profiles = create_daily_profiles(num_customers, rng)
+
+    if chunk is None:
+        yield matrix_to_records(date_range, customer_ids, generate_consumption_matrix(date_range, profiles, rng))
+    elif chunk == 'month':
+        months = date_range.to_period('M')
+        for month in months.unique():
+            month_range = date_range[months == month]
+            consumption = generate_consumption_matrix(month_range, profiles, rng)
+            yield matrix_to_records(month_range, customer_ids, consumption)
+    elif chunk == 'customers':
+        for first in range(0, num_customers, customers_per_chunk):
+            block = slice(first, first + customers_per_chunk)
+            consumption = generate_consumption_matrix(date_range, profiles[block], rng)
+            yield matrix_to_records(date_range, customer_ids[block], consumption)
+    else:
+        raise ValueError(f"Unknown chunk mode: {chunk!r}")
+
+def generate_and_save_load_profiles(num_customers=30, start='2023-01-01 00:00', end='2023-03-31 23:45',
+                                    freq='15min', seed=42, chunk='month', customers_per_chunk=1000,
+                                    fmt='parquet'):
+    """
+    This function generates realistic consumption data for num_customers customers
+    between start and end at the given interval and streams it into the
+    'consumption_data' dataset (Parquet by default, or CSV).
+    Returns the number of records written. Raises ValueError if start is after end.
+    """
+    if pd.Timestamp(start) > pd.Timestamp(end):
+        raise ValueError(f"Empty date range: start ({start}) is after end ({end})")
     print("Starting consumption data generation...")
-    
-    np.random.seed(42)  # Fix randomness to get reproducible results
-
-    # 1. Define the time period
-    start_date = datetime(2023, 1, 1)
-    end_date = datetime(2023, 3, 31, 23, 45)  # Full 3 months
-    date_range = pd.date_range(start=start_date, end=end_date, freq='15T')
-    
-    num_customers = 30
-
-    # 2. Function to create a daily load profile
-    def create_daily_profile():
-        # Each day has 96 intervals (24 hours * 4 intervals/hour)
-        # Morning peak (6 AM to 12 PM)
-        morning_peak = np.linspace(0.3, 1.5, 24)
-        # Afternoon lull (12 PM to 6 PM)
-        afternoon_lull = np.linspace(1.5, 0.4, 24)
-        # Evening peak (6 PM to 12 AM)
-        evening_peak = np.linspace(0.4, 2.5, 24)
-        # Night base load (12 AM to 6 AM)
-        night_base = np.linspace(2.5, 0.3, 24)
-        
-        profile = np.concatenate([night_base, morning_peak, afternoon_lull, evening_peak])
-        
-        # Add noise to make it more realistic
-        noise = np.random.normal(0, 0.1, 96)
-        profile = profile + noise
-        
-        # Ensure no negative or extremely small values
-        return np.maximum(profile, 0.05)
-
-    # 3. Generate data for each customer for each day
-    all_records = []
-    
-    # Pre-generate a unique profile for each customer (to save time)
-    customer_profiles = [create_daily_profile() for _ in range(num_customers)]
-
-    for timestamp in date_range:
-        time_index = timestamp.hour * 4 + timestamp.minute // 15
-        is_weekend = timestamp.weekday() >= 4  # Friday and Saturday
-
-        for i in range(num_customers):
-            # Get base consumption from the customer's profile
-            base_consumption = customer_profiles[i][time_index]
-            
-            # Adjust consumption with random variation and weekend effect
-            consumption = base_consumption * (0.9 + 0.2 * np.random.rand())
-            if is_weekend:
-                consumption *= 1.2  # Slightly higher consumption on weekends
-
-            all_records.append({
-                'Timestamp': timestamp,
-                'Customer_ID': i + 1,
-                'P_consumption_kw': round(consumption, 4)  # Power consumption in kW
-            })
-
-    # 4. Convert records to DataFrame and save as CSV
-    consumption_df = pd.DataFrame(all_records)
-    
-    file_path = 'consumption_data.csv'
-    consumption_df.to_csv(file_path, index=False)
-
-    print(f"{len(consumption_df)} consumption records successfully generated!")
+
+    num_records = 0
+    chunks = iter_load_profile_chunks(num_customers, start, end, freq, seed, chunk, customers_per_chunk)
+    with stage('generate', customers=num_customers, chunk=chunk) as info:
+        for chunk_no, consumption_df in enumerate(chunks):
+            file_path = write_dataset(consumption_df, 'consumption_data', fmt, append=chunk_no > 0, part=chunk_no)
+            num_records += len(consumption_df)
+        info.update(rows=num_records, chunks=chunk_no + 1)
+
+    print(f"{num_records} consumption records successfully generated!")
     print(f"Data saved to: {file_path}")
-    
-    return consumption_df
 
-if __name__ == '__main__':
-    consumption_df = generate_and_save_load_profiles()
-    
+    return num_records
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Generate synthetic consumption data.")
+    parser.add_argument('--customers', type=int, default=30, help="Number of customers (default: 30)")
+    parser.add_argument('--start', default='2023-01-01 00:00', help="First timestamp (default: 2023-01-01 00:00)")
+    parser.add_argument('--end', default='2023-03-31 23:45', help="Last timestamp (default: 2023-03-31 23:45)")
+    parser.add_argument('--freq', default='15min', help="Reading interval (default: 15min)")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed (default: 42)")
+    parser.add_argument('--chunk', choices=['month', 'customers', 'none'], default='month',
+                        help="Stream the output in monthly or customer chunks (default: month)")
+    parser.add_argument('--customers-per-chunk', type=int, default=1000,
+                        help="Customers per chunk when --chunk customers (default: 1000)")
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet',
+                        help="Storage format of consumption_data (default: parquet)")
+    parser.add_argument('--events', help="Append the run's stage events to this JSON Lines file")
+    parser.add_argument('--profile', help="Profile the run with cProfile and write the stats to this file")
+    args = parser.parse_args(argv)
+
+    if pd.Timestamp(args.start) > pd.Timestamp(args.end):
+        parser.error(f"--start ({args.start}) is after --end ({args.end})")
+
+    with run('generator', events_path=args.events, profile_path=args.profile, verbose=True):
+        generate_and_save_load_profiles(args.customers, args.start, args.end, args.freq, args.seed,
+                                        None if args.chunk == 'none' else args.chunk,
+                                        args.customers_per_chunk, args.format)
+
     print("\n--- Sample of generated consumption data ---")
-    print(consumption_df.head())
+    first_interval_end = pd.Timestamp(args.start) + pd.tseries.frequencies.to_offset(args.freq)
+    print(read_dataset('consumption_data', end=first_interval_end, fmt=args.format).head())
+
+if __name__ == '__main__':
+    main()
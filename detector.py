@@ -1,75 +1,572 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import joblib
-from sklearn.linear_model import LinearRegression
 from tqdm import tqdm
+from storage import read_dataset, read_distinct, iter_dataset, write_dataset
+from model_store import dataset_files, dataset_fingerprint, file_prefix_hash, load_or_train_models
+from instrumentation import run, stage, record
 
-def train_and_detect():
-    # --- Part 1: Load and split data ---
-    print("1. Loading final dataset...")
-    try:
-        df = pd.read_csv('final_dataset_with_theft.csv')
-        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-    except FileNotFoundError:
-        print("Error: 'final_dataset_with_theft.csv' not found.")
-        return
+FEATURES = ['Voltage_V', 'Total_Phase_Consumption_kw']
+TARGET = 'P_consumption_kw'
+# Readings before this date train the models, readings from it onwards are scored
+TEST_START = pd.Timestamp('2023-03-01')
+# Columns the detector reads from the final dataset
+INPUT_COLUMNS = ['Timestamp', 'Customer_ID', 'Phase', 'Transformer_ID', 'P_consumption_kw', 'Voltage_V']
+# Customers sharing a transformer and phase are each other's neighbours
+SHARD_COLUMNS = ['Transformer_ID', 'Phase']
+FLOAT64_COLUMNS = {'P_consumption_kw': 'float64', 'Voltage_V': 'float64'}
+STATE_PATH = 'detector_state.joblib'
 
-    train_df = df[df['Timestamp'] < '2023-03-01'].copy()
-    test_df = df[df['Timestamp'] >= '2023-03-01'].copy()
-    print(f"Data split: {len(train_df)} training records, {len(test_df)} testing records.")
+def _group_sums(codes, values, num_groups):
+    # Per-group column sums of a (rows x k) array in one pass per column
+    return np.stack([np.bincount(codes, weights=values[:, j], minlength=num_groups)
+                     for j in range(values.shape[1])], axis=1)
 
-    # --- Part 2: Feature Engineering ---
-    print("2. Building features (neighbors' total consumption)...")
-    total_consumption_per_phase = df.groupby(['Timestamp', 'Phase'])['P_consumption_kw'].sum().reset_index()
-    total_consumption_per_phase.rename(columns={'P_consumption_kw': 'Total_Phase_Consumption_kw'}, inplace=True)
-    train_df = pd.merge(train_df, total_consumption_per_phase, on=['Timestamp', 'Phase'], how='left')
-    test_df = pd.merge(test_df, total_consumption_per_phase, on=['Timestamp', 'Phase'], how='left')
-    
-    # --- Part 3: Train Models ---
-    print("3. Training a model for each customer...")
+def compute_customer_statistics(df, features=FEATURES, target=TARGET):
+    """
+    Computes each customer's regression sufficient statistics in one grouped pass:
+    row count, feature/target means and the centered co-moments XtX and Xty.
+    Statistics of disjoint row sets can be combined with merge_customer_statistics.
+    """
+    customer_ids, codes = np.unique(df['Customer_ID'].values, return_inverse=True)
+    num_customers = len(customer_ids)
+    X = df[features].to_numpy(dtype=np.float64)
+    y = df[target].to_numpy(dtype=np.float64)
+
+    # 1. Per-customer means
+    counts = np.bincount(codes, minlength=num_customers)
+    x_mean = _group_sums(codes, X, num_customers) / counts[:, None]
+    y_mean = np.bincount(codes, weights=y, minlength=num_customers) / counts
+
+    # 2. Per-customer centered normal equations
+    X_centered = X - x_mean[codes]
+    y_centered = y - y_mean[codes]
+    num_features = len(features)
+    xtx = np.empty((num_customers, num_features, num_features))
+    for i in range(num_features):
+        for j in range(i, num_features):
+            xtx[:, i, j] = xtx[:, j, i] = np.bincount(codes, weights=X_centered[:, i] * X_centered[:, j],
+                                                      minlength=num_customers)
+    xty = _group_sums(codes, X_centered * y_centered[:, None], num_customers)
+
+    return {'Customer_ID': customer_ids, 'Count': counts, 'X_Mean': x_mean, 'Y_Mean': y_mean,
+            'XtX': xtx, 'Xty': xty}
+
+def merge_customer_statistics(a, b):
+    """
+    Combines the sufficient statistics of two disjoint row sets exactly, using the
+    pairwise update for means and centered co-moments.
+    """
+    customer_ids = np.union1d(a['Customer_ID'], b['Customer_ID'])
+
+    def expand(stats):
+        # Place stats on the merged customer axis; customers missing from stats count 0 rows
+        pos = np.searchsorted(customer_ids, stats['Customer_ID'])
+        expanded = {}
+        for key in ('Count', 'X_Mean', 'Y_Mean', 'XtX', 'Xty'):
+            expanded[key] = np.zeros((len(customer_ids),) + stats[key].shape[1:], dtype=stats[key].dtype)
+            expanded[key][pos] = stats[key]
+        return expanded
+
+    a, b = expand(a), expand(b)
+    count = a['Count'] + b['Count']
+    weight_b = b['Count'] / count
+    cross = a['Count'] * weight_b
+    dx = b['X_Mean'] - a['X_Mean']
+    dy = b['Y_Mean'] - a['Y_Mean']
+
+    return {
+        'Customer_ID': customer_ids,
+        'Count': count,
+        'X_Mean': a['X_Mean'] + dx * weight_b[:, None],
+        'Y_Mean': a['Y_Mean'] + dy * weight_b,
+        'XtX': a['XtX'] + b['XtX'] + cross[:, None, None] * dx[:, :, None] * dx[:, None, :],
+        'Xty': a['Xty'] + b['Xty'] + cross[:, None] * dx * dy[:, None],
+    }
+
+def models_from_statistics(stats, features=FEATURES):
+    """
+    Solves every customer's normal equations at once. The solution is the same
+    least-squares fit that sklearn's LinearRegression computes (min-norm for
+    degenerate customers). Returns a DataFrame indexed by Customer_ID with an
+    'Intercept' column and one coefficient column per feature.
+    """
+    coef = np.einsum('gij,gj->gi', np.linalg.pinv(stats['XtX']), stats['Xty'])
+    intercept = stats['Y_Mean'] - np.einsum('gi,gi->g', stats['X_Mean'], coef)
+
+    models_df = pd.DataFrame(coef, index=pd.Index(stats['Customer_ID'], name='Customer_ID'), columns=features)
+    models_df.insert(0, 'Intercept', intercept)
+    return models_df
+
+def fit_customer_models(train_df, features=FEATURES, target=TARGET):
+    """
+    Fits every customer's linear regression at once from its sufficient statistics
+    (see compute_customer_statistics and models_from_statistics).
+    """
+    return models_from_statistics(compute_customer_statistics(train_df, features, target), features)
+
+def score_customers(models_df, test_df, features=FEATURES, target=TARGET):
+    """
+    Scores every modelled customer at once: the anomaly score is the sum of the
+    negative residuals (recorded minus predicted consumption) over test_df.
+    Customers without a model are skipped; modelled customers without test rows score 0.
+    """
+    test_df = test_df[test_df['Customer_ID'].isin(models_df.index)]
+    codes = models_df.index.get_indexer(test_df['Customer_ID'].values)
+    X = test_df[features].to_numpy(dtype=np.float64)
+    y = test_df[target].to_numpy(dtype=np.float64)
+
+    coef = models_df[features].to_numpy()
+    predicted_consumption = models_df['Intercept'].to_numpy()[codes] + np.einsum('ij,ij->i', X, coef[codes])
+    residual = y - predicted_consumption
+    anomaly_score = np.bincount(codes, weights=np.minimum(residual, 0.0), minlength=len(models_df))
+
+    return pd.DataFrame({'Customer_ID': models_df.index.values, 'Anomaly_Score': anomaly_score})
+
+def fit_customer_models_sklearn(train_df, features=FEATURES, target=TARGET):
+    """Reference path: one sklearn LinearRegression per customer, fitted in a loop."""
+    # Imported here: sklearn takes longer to import than the batched engine takes to run
+    from sklearn.linear_model import LinearRegression
     models = {}
     customer_ids = train_df['Customer_ID'].unique()
     for customer_id in tqdm(customer_ids, desc="Training Models"):
         customer_train_data = train_df[train_df['Customer_ID'] == customer_id]
-        features = ['Voltage_V', 'Total_Phase_Consumption_kw']
-        target = 'P_consumption_kw'
         X_train = customer_train_data[features]
         y_train = customer_train_data[target]
         model = LinearRegression()
         model.fit(X_train, y_train)
         models[customer_id] = model
-    print("All models trained successfully!")
+    return models
 
-    # --- Part 4: Detection ---
-    print("4. Starting detection on test data...")
+def score_customers_sklearn(models, test_df, features=FEATURES, target=TARGET):
+    """Reference path: predicts and scores each customer in a loop."""
     results = []
-    for customer_id in tqdm(customer_ids, desc="Detecting Anomalies"):
+    for customer_id in tqdm(models, desc="Detecting Anomalies"):
         customer_test_data = test_df[test_df['Customer_ID'] == customer_id].copy()
-        if customer_id in models:
-            model = models[customer_id]
-            X_test = customer_test_data[features]
-            predicted_consumption = model.predict(X_test)
-            customer_test_data['Residual'] = customer_test_data[target] - predicted_consumption
-            anomaly_score = customer_test_data[customer_test_data['Residual'] < 0]['Residual'].sum()
-            results.append({
-                'Customer_ID': customer_id,
-                'Anomaly_Score': anomaly_score
-            })
+        model = models[customer_id]
+        X_test = customer_test_data[features]
+        predicted_consumption = model.predict(X_test)
+        customer_test_data['Residual'] = customer_test_data[target] - predicted_consumption
+        anomaly_score = customer_test_data[customer_test_data['Residual'] < 0]['Residual'].sum()
+        results.append({
+            'Customer_ID': customer_id,
+            'Anomaly_Score': anomaly_score
+        })
+    return pd.DataFrame(results)
 
-    # --- Part 5: Save and Print Results ---
+def sklearn_models_to_frame(models, features=FEATURES):
+    """Converts a dict of fitted LinearRegression models to the fit_customer_models layout."""
+    models_df = pd.DataFrame([model.coef_ for model in models.values()],
+                             index=pd.Index(list(models), name='Customer_ID'), columns=features)
+    models_df.insert(0, 'Intercept', [model.intercept_ for model in models.values()])
+    return models_df.sort_index()
+
+def load_readings(phases=None, start=None, end=None, transformers=None):
+    """
+    Reads the detector's columns from the final dataset, optionally limited to some
+    phases and transformers and to the [start, end) time window. Values are
+    converted to float64.
+    """
+    # Only the columns the models need are read; phases restricts the read to those partitions
+    df = read_dataset('final_dataset_with_theft', columns=INPUT_COLUMNS, phases=phases, start=start, end=end,
+                      transformers=transformers)
+    # Stored as float32; fit and score in float64
+    return df.astype(FLOAT64_COLUMNS)
+
+def readings_summary(df):
+    """Row count and time span of a frame of readings, as instrumentation fields."""
+    if not len(df):
+        return {'rows': 0}
+    return {'rows': len(df), 'start': str(df['Timestamp'].min()), 'end': str(df['Timestamp'].max())}
+
+def iter_readings(phases=None, start=None, end=None, chunk='1D'):
+    """Like load_readings, but yields the readings in time-ordered chunks of whole timestamps."""
+    for df in iter_dataset('final_dataset_with_theft', columns=INPUT_COLUMNS, chunk=chunk, phases=phases,
+                           start=start, end=end):
+        yield df.astype(FLOAT64_COLUMNS)
+
+def add_neighbour_totals(df):
+    """
+    Adds Total_Phase_Consumption_kw to every reading: the total consumption of the
+    other customers on the same transformer and phase at the same timestamp. The
+    group totals are summed with one bincount and the customer's own load is
+    subtracted, so no totals table is merged back onto the readings.
+    """
+    groups = df.groupby(['Timestamp'] + SHARD_COLUMNS, observed=True, sort=False).ngroup().to_numpy()
+    consumption = df['P_consumption_kw'].to_numpy(dtype=np.float64)
+    totals = np.bincount(groups, weights=consumption)
+    return df.assign(Total_Phase_Consumption_kw=totals[groups] - consumption)
+
+def split_with_phase_totals(df):
+    """
+    Adds the neighbours' total phase consumption to every reading and splits the
+    readings into the training (before TEST_START) and testing frames.
+    """
+    df = add_neighbour_totals(df)
+    is_train = (df['Timestamp'] < TEST_START).to_numpy()
+    return df[is_train], df[~is_train]
+
+def labelled_thieves():
+    """IDs of the customers with Is_Theft readings in the final dataset."""
+    labels = read_distinct('final_dataset_with_theft', ['Customer_ID', 'Is_Theft'])
+    return labels.loc[labels['Is_Theft'] > 0, 'Customer_ID'].astype(int).unique()
+
+def save_and_report(results_df, fmt):
+    """Ranks the customers by anomaly score, saves the results and reports the labelled thieves' ranks."""
     print("\n--- Detection Complete! ---")
-    results_df = pd.DataFrame(results)
     results_df = results_df.sort_values(by='Anomaly_Score', ascending=True)
 
-    results_df.to_csv('anomaly_results.csv', index=False)
-    print("Detection results saved to 'anomaly_results.csv'")
+    with stage('save', rows=len(results_df)):
+        file_path = write_dataset(results_df, 'anomaly_results', fmt)
+    print(f"Detection results saved to '{file_path}'")
 
     ranked_df = results_df.reset_index(drop=True)
+    thieves = labelled_thieves()
+    is_thief = ranked_df['Customer_ID'].isin(thieves).to_numpy()
+    thief_ranks = (np.flatnonzero(is_thief) + 1).tolist()
+    # رسالة بسيطة بدون رموز
+    if not len(thieves):
+        print("NOTE: The dataset has no labelled thieves (Is_Theft).")
+    else:
+        print(f"Thieves found: {int(is_thief[:len(thieves)].sum())} of {len(thieves)} labelled thieves ranked in the "
+              f"top {len(thieves)}; thieves at ranks: {thief_ranks[:10]}{' ...' if len(thief_ranks) > 10 else ''}")
+        if len(thief_ranks) < len(thieves):
+            print(f"NOTE: {len(thieves) - len(thief_ranks)} labelled thieves were not found in the results.")
+    record('ranking', customers=len(ranked_df), thieves=len(thieves), thief_ranks=thief_ranks[:100])
+    return ranked_df
+
+def train_and_detect(phases=None, fmt='parquet', engine='batched', end=None, use_cache=True):
+    # --- Part 1: Load and split data ---
+    print("1. Loading final dataset...")
     try:
-        thief_rank = ranked_df[ranked_df['Customer_ID'] == 5].index[0] + 1
-        # رسالة بسيطة بدون رموز
-        print(f"SUCCESS: Actual thief (Customer #5) detected at rank: #{thief_rank}")
-    except IndexError:
-        print(f"NOTE: The designated thief (Customer #5) was not found in the results.")
+        with stage('load') as info:
+            df = load_readings(phases=phases, end=end)
+            info.update(readings_summary(df))
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return
+
+    # --- Part 2: Feature Engineering ---
+    print("2. Building features (neighbors' total consumption)...")
+    with stage('features', rows=len(df)) as info:
+        train_df, test_df = split_with_phase_totals(df)
+        info.update(train_rows=len(train_df), test_rows=len(test_df))
+    print(f"Data split: {len(train_df)} training records, {len(test_df)} testing records.")
+
+    # --- Part 3: Train Models ---
+    print("3. Training a model for each customer...")
+    fit = fit_customer_models_sklearn if engine == 'sklearn' else fit_customer_models
+    with stage('fit', engine=engine, rows=len(train_df)) as info:
+        if use_cache:
+            key_parts = {'data_fingerprint': dataset_fingerprint('final_dataset_with_theft'), 'phases': phases,
+                         'train_end': min(pd.Timestamp(end), TEST_START) if end is not None else TEST_START,
+                         'features': FEATURES, 'target': TARGET, 'engine': engine}
+            models, cache_info = load_or_train_models(train_df, fit, key_parts, FEATURES + [TARGET])
+            if cache_info['status'] == 'hit':
+                print(f"Model cache hit ({cache_info['key']}): loaded {cache_info['reused']} models, "
+                      f"saved ~{cache_info['seconds_saved']:.2f} s of training.")
+            else:
+                print(f"Model cache miss ({cache_info['key']}): retrained {cache_info['retrained']} customers, "
+                      f"reused {cache_info['reused']} unchanged models, saved ~{cache_info['seconds_saved']:.2f} s; "
+                      f"evicted {cache_info['evicted']} old generations.")
+            info.update(cache=cache_info['status'], retrained=cache_info['retrained'], reused=cache_info['reused'])
+        else:
+            models = fit(train_df)
+        info['customers'] = len(models)
+    print("All models trained successfully!")
+
+    # --- Part 4: Detection ---
+    print("4. Starting detection on test data...")
+    with stage('score', rows=len(test_df)) as info:
+        if engine == 'sklearn':
+            results_df = score_customers_sklearn(models, test_df)
+        else:
+            results_df = score_customers(models, test_df)
+        info['customers'] = len(results_df)
+
+    # --- Part 5: Save and Print Results ---
+    return save_and_report(results_df, fmt)
+
+def list_shards(phases=None):
+    """Returns the (Transformer_ID, Phase) shards of the final dataset, optionally limited to some phases."""
+    shards = read_distinct('final_dataset_with_theft', SHARD_COLUMNS)
+    if phases is not None:
+        shards = shards[shards['Phase'].isin(phases)]
+    return list(shards.itertuples(index=False, name=None))
+
+def detect_shard(shard, end=None):
+    """
+    Trains and scores the customers of one (Transformer_ID, Phase) shard, reading
+    only that shard's readings. Returns the shard's ranking.
+    """
+    transformer_id, phase = shard
+    df = load_readings(phases=[phase], transformers=[transformer_id], end=end)
+    train_df, test_df = split_with_phase_totals(df)
+    del df
+    results_df = score_customers(fit_customer_models(train_df), test_df)
+    results_df['Transformer_ID'] = transformer_id
+    results_df['Phase'] = phase
+    return results_df.sort_values(by='Anomaly_Score', ascending=True)
+
+def run_sharded_detection(phases=None, fmt='parquet', end=None, workers=1):
+    """
+    Detection split into (Transformer_ID, Phase) shards. Neighbours only ever share
+    a shard, so each shard is loaded, featurized, trained and scored on its own
+    across `workers` processes, and the per-shard rankings are merged at the end.
+    Each worker only holds one shard at a time, so peak memory is bounded by the
+    largest shard rather than the whole dataset. The scores match train_and_detect.
+    """
+    # --- Part 1: Find the shards ---
+    print("1. Listing transformer/phase shards...")
+    try:
+        with stage('list_shards') as info:
+            shards = list_shards(phases)
+            info['shards'] = len(shards)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return
+    print(f"Found {len(shards)} shards.")
+
+    # --- Part 2: Train and score each shard ---
+    print(f"2. Training and scoring the shards on {workers} worker(s)...")
+    # Worker processes have no current run; the stage covers all shards and their peak is not included
+    with stage('detect_shards', shards=len(shards), workers=workers) as info:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                rankings = list(tqdm(executor.map(detect_shard, shards, [end] * len(shards)), total=len(shards),
+                                     desc="Detecting shards"))
+        else:
+            rankings = [detect_shard(shard, end) for shard in tqdm(shards, desc="Detecting shards")]
+        info['customers'] = sum(len(ranking) for ranking in rankings)
+
+    # --- Part 3: Merge the rankings, save and print results ---
+    return save_and_report(pd.concat(rankings, ignore_index=True), fmt)
+
+def run_streaming_detection(phases=None, fmt='parquet', end=None, chunk='1D'):
+    """
+    Out-of-core detection for datasets larger than memory. The readings are read
+    in time-ordered chunks of whole timestamps (chunk is a pandas frequency), so
+    the neighbour totals of every chunk are complete. The first pass folds the
+    training chunks into each customer's regression sufficient statistics; the
+    second pass scores the testing chunks with the fitted models and accumulates
+    the anomaly scores. Peak memory is O(customers + chunk size). The scores match
+    train_and_detect up to floating-point rounding.
+    """
+    train_end = TEST_START if end is None else min(pd.Timestamp(end), TEST_START)
+
+    # --- Part 1: First pass, training statistics ---
+    print(f"1. Pass 1: accumulating training statistics in {chunk} chunks...")
+    stats, num_train = None, 0
+    try:
+        with stage('fit', chunk=chunk) as info:
+            for df in tqdm(iter_readings(phases=phases, end=train_end, chunk=chunk), desc="Training chunks"):
+                train_df, _ = split_with_phase_totals(df)
+                chunk_stats = compute_customer_statistics(train_df)
+                stats = chunk_stats if stats is None else merge_customer_statistics(stats, chunk_stats)
+                num_train += len(train_df)
+            info['rows'] = num_train
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return
+    if stats is None:
+        print("NOTE: No training data, nothing to rank.")
+        return
+    models_df = models_from_statistics(stats)
+    print(f"Trained {len(models_df)} models on {num_train} training records.")
+
+    # --- Part 2: Second pass, anomaly scores ---
+    print(f"2. Pass 2: scoring testing data in {chunk} chunks...")
+    scores, num_test = np.zeros(len(models_df)), 0
+    with stage('score', chunk=chunk, customers=len(models_df)) as info:
+        for df in tqdm(iter_readings(phases=phases, start=TEST_START, end=end, chunk=chunk), desc="Testing chunks"):
+            _, test_df = split_with_phase_totals(df)
+            scores += score_customers(models_df, test_df)['Anomaly_Score'].to_numpy()
+            num_test += len(test_df)
+        info['rows'] = num_test
+    print(f"Scored {num_test} testing records.")
+
+    # --- Part 3: Save and Print Results ---
+    return save_and_report(pd.DataFrame({'Customer_ID': models_df.index.values, 'Anomaly_Score': scores}), fmt)
+
+def empty_incremental_state():
+    return {'last_timestamp': None, 'stats': None, 'models': None,
+            'scores': pd.Series(dtype=np.float64, name='Anomaly_Score'),
+            'history_checksum': 0, 'snapshot': None}
+
+def load_incremental_state(state_path=STATE_PATH):
+    """Loads the incremental detection state, or returns an empty one."""
+    try:
+        return joblib.load(state_path)
+    except FileNotFoundError:
+        return empty_incremental_state()
+
+def history_checksum(df):
+    """
+    Checksum of a frame of readings: the sum (mod 2**64) of its row hashes, so it does
+    not depend on row order and the checksums of consecutive intervals add up.
+    """
+    return int(pd.util.hash_pandas_object(df[INPUT_COLUMNS], index=False).to_numpy().sum())
+
+def dataset_snapshot():
+    """
+    The files of the final dataset as the incremental state saw them: the dataset's
+    path, {relative path: (size, mtime)} and, for a CSV dataset, the hash of the
+    bytes it held, so an append (which only grows the file) can be recognised.
+    """
+    path, files = dataset_files('final_dataset_with_theft')
+    prefix_sha256 = file_prefix_hash(path, files['.'][0]) if not os.path.isdir(path) else None
+    return {'path': path, 'files': files, 'prefix_sha256': prefix_sha256}
+
+def snapshot_is_prefix(snapshot):
+    """
+    Whether the dataset only grew since the snapshot: every Parquet file it saw is
+    unchanged (appends only add new part files), or the CSV file still starts with
+    the bytes it held. Compares file metadata, plus one hash of the CSV prefix.
+    """
+    path, files = dataset_files('final_dataset_with_theft')
+    if snapshot is None or path != snapshot['path']:
+        return False
+    if snapshot['prefix_sha256'] is None:
+        return all(files.get(relpath) == entry for relpath, entry in snapshot['files'].items())
+    size = snapshot['files']['.'][0]
+    return files['.'][0] >= size and file_prefix_hash(path, size) == snapshot['prefix_sha256']
+
+def incremental_state_is_current(state):
+    """
+    Whether the readings folded into the state are still the start of the final
+    dataset, i.e. the dataset only had readings appended since. This is decided from
+    the files the state saw (see snapshot_is_prefix); only when one of them changed
+    or disappeared are the readings up to state['last_timestamp'] read again and
+    compared with the state's checksum (a regenerated dataset fails this check).
+    """
+    if state['last_timestamp'] is None:
+        return True
+    if snapshot_is_prefix(state.get('snapshot')):
+        return True
+    with stage('verify_state') as info:
+        df = load_readings(end=state['last_timestamp'] + pd.Timedelta(1, 'ns'))
+        info['rows'] = len(df)
+        return history_checksum(df) == state.get('history_checksum')
+
+def update_incremental_state(state, end=None):
+    """
+    Reads the readings newer than state['last_timestamp'] (up to end) and folds them
+    into the state: new training readings are merged into the sufficient statistics
+    and the models are refit in O(customers); new testing readings are scored with
+    the current models and added to the running scores.
+    Returns the number of (training, testing) readings that were added.
+    """
+    start = None if state['last_timestamp'] is None else state['last_timestamp'] + pd.Timedelta(1, 'ns')
+    # Taken before reading, so files written during the read are treated as new on the next run
+    snapshot = dataset_snapshot()
+    with stage('load', since=None if start is None else str(start)) as info:
+        df = load_readings(start=start, end=end)
+        info.update(readings_summary(df))
+    if not len(df):
+        state['snapshot'] = snapshot
+        return 0, 0
+
+    # 1. Update the statistics and refit
+    with stage('features', rows=len(df)) as info:
+        train_df, test_df = split_with_phase_totals(df)
+        info.update(train_rows=len(train_df), test_rows=len(test_df))
+    if len(train_df):
+        with stage('fit', rows=len(train_df)) as info:
+            new_stats = compute_customer_statistics(train_df)
+            state['stats'] = new_stats if state['stats'] is None else merge_customer_statistics(state['stats'], new_stats)
+            state['models'] = models_from_statistics(state['stats'])
+            info['customers'] = len(state['models'])
+
+    # 2. Score the new interval
+    if len(test_df) and state['models'] is not None:
+        with stage('score', rows=len(test_df)) as info:
+            new_scores = score_customers(state['models'], test_df).set_index('Customer_ID')['Anomaly_Score']
+            state['scores'] = state['scores'].add(new_scores, fill_value=0.0)
+            info['customers'] = len(new_scores)
+
+    state['last_timestamp'] = df['Timestamp'].max()
+    state['history_checksum'] = (state.get('history_checksum', 0) + history_checksum(df)) % 2 ** 64
+    state['snapshot'] = snapshot
+    return len(train_df), len(test_df)
+
+def incremental_results(state):
+    """Ranks the customers by their running anomaly score; None before any training data."""
+    if state['models'] is None:
+        return None
+    scores = state['scores'].reindex(state['models'].index, fill_value=0.0)
+    results_df = pd.DataFrame({'Customer_ID': scores.index.values, 'Anomaly_Score': scores.values})
+    return results_df.sort_values(by='Anomaly_Score', ascending=True).reset_index(drop=True)
+
+def run_incremental_detection(end=None, fmt='parquet', state_path=STATE_PATH):
+    """
+    Daily detection cycle that only reads the readings that arrived since the last run.
+
+    Each customer's regression sufficient statistics and running anomaly score are
+    persisted in state_path (see update_incremental_state). Because readings are
+    consumed in time order, the ranking matches train_and_detect(end=...) on the
+    same window.
+    """
+    # --- Part 1: Load the saved state and the new interval ---
+    state = load_incremental_state(state_path)
+    try:
+        if not incremental_state_is_current(state):
+            print("NOTE: The dataset was regenerated since the last run; rebuilding the state from scratch.")
+            record('state_reset', last_timestamp=state['last_timestamp'])
+            state = empty_incremental_state()
+        print(f"1. Loading new readings since {state['last_timestamp'] or 'the beginning'}...")
+        num_train, num_test = update_incremental_state(state, end=end)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return
+
+    # --- Part 2: Save the updated state ---
+    if num_train or num_test:
+        print(f"2. New data: {num_train} training records, {num_test} testing records.")
+        with stage('save_state'):
+            joblib.dump(state, state_path)
+    else:
+        print("2. No new readings; re-ranking the saved scores.")
+
+    # --- Part 3: Re-rank ---
+    results_df = incremental_results(state)
+    if results_df is None:
+        print("NOTE: No training data yet, nothing to rank.")
+        return
+    return save_and_report(results_df, fmt)
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Train per-customer models and detect anomalies.")
+    parser.add_argument('--phases', nargs='+', choices=['A', 'B', 'C'], help="Only analyse these phases")
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet',
+                        help="Storage format of anomaly_results (default: parquet)")
+    parser.add_argument('--engine', choices=['batched', 'sklearn'], default='batched',
+                        help="Model fitting engine (default: batched)")
+    parser.add_argument('--end', help="Only use readings before this timestamp")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"Only process readings that arrived since the last run (state kept in {STATE_PATH})")
+    parser.add_argument('--no-cache', action='store_true', help="Always retrain every model instead of using the model cache")
+    parser.add_argument('--sharded', action='store_true',
+                        help="Train and score each transformer/phase shard separately, bounding memory by the largest shard")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes for --sharded (default: 1)")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Read the dataset in time-ordered chunks in two passes, for datasets larger than memory")
+    parser.add_argument('--chunk', default='1D', help="Chunk length for --streaming, as a pandas frequency (default: 1D)")
+    parser.add_argument('--events', help="Append the run's stage events to this JSON Lines file")
+    parser.add_argument('--profile', help="Profile the run with cProfile and write the stats to this file")
+    args = parser.parse_args(argv)
+    with run('detector', events_path=args.events, profile_path=args.profile, verbose=True):
+        if args.incremental:
+            run_incremental_detection(end=args.end, fmt=args.format)
+        elif args.sharded:
+            run_sharded_detection(phases=args.phases, fmt=args.format, end=args.end, workers=args.workers)
+        elif args.streaming:
+            run_streaming_detection(phases=args.phases, fmt=args.format, end=args.end, chunk=args.chunk)
+        else:
+            train_and_detect(phases=args.phases, fmt=args.format, engine=args.engine, end=args.end,
+                             use_cache=not args.no_cache)
 
 if __name__ == '__main__':
-    train_and_detect()
+    main()
@@ -0,0 +1,132 @@
+import contextlib
+import contextvars
+import cProfile
+import json
+import sys
+import threading
+import time
+from datetime import datetime
+
+# The run that stage() and record() report to; each thread or task sees the run it entered
+_current_run = contextvars.ContextVar('current_run', default=None)
+
+def peak_rss_mb():
+    """Memory high-water mark of this process in MB, or None where it cannot be read."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+class Run:
+    """
+    Structured events of one pipeline run. Every event is a flat dict with the time,
+    the run name, the event type and its fields. Events are kept in memory (so the
+    dashboard can render them while the run is in progress), passed to the listeners
+    as they happen, and appended to events_path as JSON Lines when it is set.
+    """
+
+    def __init__(self, name, events_path=None, listeners=()):
+        self.name = name
+        self.events_path = events_path
+        self.events = []
+        self._listeners = list(listeners)
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        event = {'time': datetime.now().isoformat(timespec='milliseconds'), 'run': self.name, 'event': event, **fields}
+        with self._lock:
+            self.events.append(event)
+            if self.events_path:
+                with open(self.events_path, 'a') as f:
+                    f.write(json.dumps(event, default=str) + '\n')
+        for listener in self._listeners:
+            listener(event)
+        return event
+
+    def events_since(self, index):
+        """Events emitted after the first index events, for incremental rendering."""
+        with self._lock:
+            return self.events[index:]
+
+    def stages(self):
+        """The stage events of the run, in the order the stages finished."""
+        with self._lock:
+            return [event for event in self.events if event['event'] == 'stage']
+
+def current_run():
+    return _current_run.get()
+
+@contextlib.contextmanager
+def run(name, events_path=None, profile_path=None, listeners=(), verbose=False):
+    """
+    Makes a run current for the enclosed code, so the stage() and record() calls of
+    every pipeline function it calls report to it. name is a run name or an existing
+    Run (e.g. one created up front so another thread can watch it). With profile_path
+    the run is profiled with cProfile and the stats are dumped there (read them with
+    pstats or snakeviz). With verbose, a per-stage summary is printed at the end.
+    """
+    current = name if isinstance(name, Run) else Run(name, events_path, listeners)
+    token = _current_run.set(current)
+    profiler = cProfile.Profile() if profile_path else None
+    current.emit('run_start')
+    start = time.perf_counter()
+    error = None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        yield current
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        _current_run.reset(token)
+        current.emit('run_end', seconds=time.perf_counter() - start, peak_rss_mb=peak_rss_mb(), error=error,
+                     profile=profile_path)
+        if verbose:
+            print_summary(current)
+
+@contextlib.contextmanager
+def stage(name, **fields):
+    """
+    Times the enclosed code as one stage of the current run. The yielded dict takes
+    the stage's results (e.g. info['rows'] = len(df)); they are emitted together with
+    the wall time and the memory high-water mark when the stage ends. Outside a run,
+    or when the stage raises, nothing is recorded.
+    """
+    current = _current_run.get()
+    info = dict(fields)
+    start = time.perf_counter()
+    yield info
+    if current is not None:
+        current.emit('stage', stage=name, seconds=time.perf_counter() - start, peak_rss_mb=peak_rss_mb(), **info)
+
+def record(event, **fields):
+    """Emits a single event (counters, convergence failures, ...) on the current run, if any."""
+    current = _current_run.get()
+    if current is not None:
+        current.emit(event, **fields)
+
+def print_summary(current):
+    """Prints the wall time, rows and memory high-water mark of every stage of a run."""
+    stages = current.stages()
+    if not stages:
+        return
+    total = sum(event['seconds'] for event in stages)
+    print(f"\n--- Stage timings ({current.name}) ---")
+    for event in stages:
+        rows = f"{event['rows']:>12,} rows" if 'rows' in event else ' ' * 17
+        print(f"{event['stage']:<18} {event['seconds']:9.3f} s ({event['seconds'] / max(total, 1e-12):6.1%}) "
+              f"{rows}   peak {event['peak_rss_mb'] or 0:8.1f} MB")
@@ -0,0 +1,169 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from storage import dataset_path, resolve_format
+
+CACHE_DIR = 'model_cache'
+
+def dataset_files(name):
+    """
+    Returns (path, files) for a dataset: its on-disk path and {relative path:
+    (size, modification time)} of every file in it, without reading the data.
+    """
+    path = dataset_path(name, resolve_format(name))
+    files = sorted(glob.glob(os.path.join(path, '**', '*'), recursive=True)) if os.path.isdir(path) else [path]
+    return path, {os.path.relpath(f, path): (os.path.getsize(f), os.stat(f).st_mtime_ns)
+                  for f in files if os.path.isfile(f)}
+
+def dataset_fingerprint(name):
+    """
+    Fingerprints a dataset from its files' paths, sizes and modification times,
+    without reading the data.
+    """
+    _, files = dataset_files(name)
+    entries = [(relpath, size, mtime) for relpath, (size, mtime) in files.items()]
+    return hashlib.sha256(json.dumps(entries).encode()).hexdigest()
+
+def file_prefix_hash(path, size, block_size=1 << 20):
+    """SHA-256 of the first size bytes of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while size > 0:
+            block = f.read(min(block_size, size))
+            if not block:
+                break
+            digest.update(block)
+            size -= len(block)
+    return digest.hexdigest()
+
+def write_atomically(path, write):
+    """
+    Writes a cache file through write(binary file) into a temporary file in the same
+    directory and moves it into place, so a concurrent reader (another run or a
+    worker process) never sees a partial file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def cache_key(**parts):
+    """Content hash of everything that determines the trained models."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def customer_hashes(train_df, columns):
+    """
+    Per-customer checksum of the training rows: the sum (mod 2**64) of the row hashes,
+    so it does not depend on row order. Returns a Series indexed by Customer_ID.
+    """
+    row_hashes = pd.util.hash_pandas_object(train_df[['Timestamp', 'Customer_ID'] + columns], index=False).to_numpy()
+    customer_ids, codes = np.unique(train_df['Customer_ID'].values, return_inverse=True)
+    order = np.argsort(codes, kind='stable')
+    starts = np.searchsorted(codes[order], np.arange(len(customer_ids)))
+    sums = np.add.reduceat(row_hashes[order], starts)
+    return pd.Series(sums, index=pd.Index(customer_ids, name='Customer_ID'))
+
+def select_models(models, customer_ids):
+    """Subset of a model collection (DataFrame of coefficients or dict of estimators)."""
+    if isinstance(models, pd.DataFrame):
+        return models.loc[models.index.intersection(customer_ids)]
+    return {cid: models[cid] for cid in customer_ids if cid in models}
+
+def combine_models(reused, retrained):
+    if isinstance(reused, pd.DataFrame):
+        return pd.concat([reused, retrained]).sort_index()
+    return {**reused, **retrained}
+
+def _generations(cache_dir):
+    """Saved generations, newest first."""
+    generations = []
+    for path in glob.glob(os.path.join(cache_dir, '*.joblib')):
+        generations.append((os.path.getmtime(path), path))
+    return [path for _, path in sorted(generations, reverse=True)]
+
+def evict_generations(cache_dir=CACHE_DIR, max_generations=5, max_age_days=30):
+    """Deletes generations beyond the newest max_generations or older than max_age_days."""
+    cutoff = time.time() - max_age_days * 86400
+    evicted = 0
+    for rank, path in enumerate(_generations(cache_dir)):
+        if rank >= max_generations or os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            evicted += 1
+    return evicted
+
+def load_or_train_models(train_df, fit, key_parts, hash_columns, cache_dir=CACHE_DIR,
+                         max_generations=5, max_age_days=30):
+    """
+    Returns the models for train_df, training as little as possible.
+
+    key_parts identify the training slice (data fingerprint, training window,
+    features, ...). If a generation with the same key exists it is loaded as is.
+    Otherwise only the customers whose training rows changed since the newest
+    generation trained with the same settings are refitted with fit(); the others
+    reuse their saved models. The new generation is saved and old ones evicted.
+    Returns (models, info) where info describes the cache outcome for the run log.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    key = cache_key(**key_parts)
+    path = os.path.join(cache_dir, f"{key}.joblib")
+    settings = {k: v for k, v in key_parts.items() if k != 'data_fingerprint'}
+
+    # 1. Exact hit: same data, window and features
+    if os.path.exists(path):
+        start = time.perf_counter()
+        generation = joblib.load(path)
+        os.utime(path)
+        load_seconds = time.perf_counter() - start
+        return generation['models'], {'status': 'hit', 'key': key, 'retrained': 0,
+                                      'reused': len(generation['customer_hashes']),
+                                      'seconds_saved': max(generation['fit_seconds'] - load_seconds, 0.0)}
+
+    # 2. Miss: reuse the unchanged customers of the newest compatible generation
+    hashes = customer_hashes(train_df, hash_columns)
+    previous = None
+    for candidate in _generations(cache_dir):
+        generation = joblib.load(candidate)
+        if generation['settings'] == settings:
+            previous = generation
+            break
+
+    changed = hashes.index
+    reused_models = None
+    if previous is not None:
+        old_hashes = previous['customer_hashes']
+        known = hashes.index.isin(old_hashes.index)
+        unchanged = np.zeros(len(hashes), dtype=bool)
+        unchanged[known] = old_hashes.loc[hashes.index[known]].to_numpy() == hashes.to_numpy()[known]
+        changed = hashes.index[~unchanged]
+        reused_models = select_models(previous['models'], hashes.index.difference(changed))
+
+    start = time.perf_counter()
+    if len(changed) or previous is None:
+        retrained = fit(train_df[train_df['Customer_ID'].isin(changed)])
+    else:
+        retrained = select_models(previous['models'], [])
+    fit_seconds = time.perf_counter() - start
+    models = retrained if reused_models is None else combine_models(reused_models, retrained)
+
+    # Estimate what training every customer would have cost from this run or the previous one
+    if len(changed):
+        full_fit_seconds = fit_seconds / len(changed) * len(hashes)
+    else:
+        full_fit_seconds = previous['fit_seconds'] if previous is not None else fit_seconds
+
+    generation = {'key': key, 'settings': settings, 'models': models, 'customer_hashes': hashes,
+                  'fit_seconds': full_fit_seconds}
+    write_atomically(path, lambda f: joblib.dump(generation, f))
+    evicted = evict_generations(cache_dir, max_generations, max_age_days)
+    return models, {'status': 'miss', 'key': key, 'retrained': len(changed), 'reused': len(hashes) - len(changed),
+                    'seconds_saved': full_fit_seconds - fit_seconds, 'evicted': evicted}
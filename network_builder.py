@@ -1,68 +1,217 @@
+import argparse
+import json
+import os
+import pickle
+import time
+import numpy as np
 import pandapower as pp
 import pandas as pd
+from model_store import cache_key, write_atomically
+from instrumentation import record
 
-def create_egyptian_lv_network():
+NETWORK_CACHE_DIR = 'network_cache'
+# Bump when build_network or generate_topology change what they produce, so cached networks are rebuilt
+NETWORK_BUILDER_VERSION = 2
+
+# Default layout: the original single 400 kVA transformer with 30 customers on
+# short service cables, split 10/12/8 over phases A/B/C
+DEFAULT_CONFIG = {
+    'transformers': 1,
+    'feeders_per_transformer': 1,
+    'customers_per_feeder': 30,
+    'phase_weights': [10, 12, 8],      # Customers on phases A/B/C, relative to each other
+    'transformer_sn_mva': 0.4,         # Transformer rating: 400kVA
+    'segment_km': 0.0,                 # Feeder cable between consecutive customers (0 = all on the LV busbar)
+    'service_km': 0.005,               # Service cable from the feeder to the meter
+    'feeder_std_type': "NAYY 4x150 SE",
+    'service_std_type': "NAYY 4x50 SE",
+}
+
+def load_network_config(path=None, **overrides):
+    """Returns DEFAULT_CONFIG updated with a JSON config file and keyword overrides."""
+    config = dict(DEFAULT_CONFIG)
+    if path is not None:
+        with open(path) as f:
+            config.update(json.load(f))
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    return config
+
+def generate_topology(config=None):
     """
-    This function builds a virtual three-phase low voltage distribution network
-    with a manually defined transformer to ensure compatibility.
+    Builds the customer topology table for a config: one row per customer with its
+    Customer_ID, Transformer_ID, Feeder_ID, Position along the feeder (0 = closest
+    to the transformer) and Phase. Within each transformer, customers are assigned
+    to phases A/B/C in consecutive blocks sized by phase_weights.
     """
+    config = load_network_config(**(config or {}))
+    num_transformers = config['transformers']
+    num_feeders = config['feeders_per_transformer']
+    per_feeder = config['customers_per_feeder']
+    per_transformer = num_feeders * per_feeder
+
+    customer_no = np.arange(num_transformers * per_transformer)
+    rank = customer_no % per_transformer
+    weights = np.asarray(config['phase_weights'], dtype=float)
+    cutoffs = np.round(np.cumsum(weights) / weights.sum() * per_transformer)
+    phases = np.array(['A', 'B', 'C'])[np.searchsorted(cutoffs, rank, side='right')]
+
+    return pd.DataFrame({
+        'Customer_ID': customer_no + 1,
+        'Transformer_ID': customer_no // per_transformer + 1,
+        'Feeder_ID': customer_no // per_feeder + 1,
+        'Position': customer_no % per_feeder,
+        'Phase': phases,
+    })
+
+def build_network(topology_df, config=None):
+    """
+    Builds the pandapower network for a topology table with bulk element creation.
+
+    Layout: one 11 kV station feeding every transformer. Each feeder runs from its
+    transformer's LV busbar through one junction per customer position, in
+    ascending Position order (any start, gaps allowed; Feeder_ID only needs to be
+    unique within its transformer), and each customer meter hangs off its junction
+    on a service cable. With segment_km=0 the meters connect straight to the LV
+    busbar. Returns (net, topology_df) with the Bus_ID of every customer added to
+    the table.
+    """
+    config = load_network_config(**(config or {}))
+    topology_df = topology_df.sort_values('Customer_ID').reset_index(drop=True)
+    transformer_ids = np.unique(topology_df['Transformer_ID'].values)
+
     # 1. Create an empty electrical network
     net = pp.create_empty_network(name="Egyptian Protection Network")
 
-    # 2. Create main connection points (Buses)
+    # 2. Create main connection points (Buses): the MV station and one LV busbar per transformer
     hv_bus = pp.create_bus(net, vn_kv=11, name="Medium Voltage Station (11kV)")
-    lv_bus = pp.create_bus(net, vn_kv=0.4, name="Low Voltage Station (0.4kV)")
-    
+    lv_buses = pp.create_buses(net, len(transformer_ids), vn_kv=0.4,
+                               name=[f"Low Voltage Station {t} (0.4kV)" for t in transformer_ids])
     pp.create_ext_grid(net, bus=hv_bus)
 
-    # 3. ***** Solution: Define transformer manually *****
-    # Instead of using std_type, use create_transformer_from_parameters
-    # These are standard technical values for distribution transformers in Egypt
-    pp.create_transformer_from_parameters(net, 
-                                          hv_bus=hv_bus, 
-                                          lv_bus=lv_bus, 
-                                          sn_mva=0.4,      # Transformer rating: 400kVA
-                                          vn_hv_kv=11,     # Input voltage
-                                          vn_lv_kv=0.4,    # Output voltage
-                                          vkr_percent=0.9, # Copper resistance
-                                          vk_percent=4,    # Total impedance
-                                          pfe_kw=0.7,      # Iron loss
-                                          i0_percent=0.18) # No-load current
-
-    # 4. Distribute customers on the network
-    customer_data = []
-    num_customers = 30
-    
-    for i in range(num_customers):
-        if i < 10:
-            phase = 'A'
-        elif i < 22:
-            phase = 'B'
-        else:
-            phase = 'C'
-
-        customer_bus = pp.create_bus(net, vn_kv=0.4, name=f"Customer Meter {i+1}")
-        pp.create_line(net, from_bus=lv_bus, to_bus=customer_bus, length_km=0.005, std_type="NAYY 4x50 SE")
-        
-        customer_data.append({
-            'Customer_ID': i + 1,
-            'Bus_ID': customer_bus,
-            'Phase': phase
-        })
-
-    # 5. Create a DataFrame to map customers to the network
-    topology_df = pd.DataFrame(customer_data)
-
-    print("The virtual electrical network has been successfully created!")
-    print(f"Total number of customers: {len(net.bus) - 2}")
+    # 3. Define transformers manually with standard technical values for distribution transformers in Egypt
+    pp.create_transformers_from_parameters(net,
+                                           hv_buses=np.full(len(transformer_ids), hv_bus),
+                                           lv_buses=lv_buses,
+                                           sn_mva=config['transformer_sn_mva'],
+                                           vn_hv_kv=11,     # Input voltage
+                                           vn_lv_kv=0.4,    # Output voltage
+                                           vkr_percent=0.9, # Copper resistance
+                                           vk_percent=4,    # Total impedance
+                                           pfe_kw=0.7,      # Iron loss
+                                           i0_percent=0.18) # No-load current
+    transformer_bus = pd.Series(lv_buses, index=transformer_ids)
+    busbar = transformer_bus.loc[topology_df['Transformer_ID'].values].values
+
+    # 4. Feeder junctions, chained from the LV busbar along each feeder
+    if config['segment_km'] > 0:
+        keys = ['Transformer_ID', 'Feeder_ID', 'Position']
+        junctions = topology_df[keys].drop_duplicates().sort_values(keys).reset_index(drop=True)
+        junction_no = junctions.groupby(['Transformer_ID', 'Feeder_ID']).cumcount().values + 1
+        junction_buses = pp.create_buses(net, len(junctions), vn_kv=0.4,
+                                         name=[f"Transformer {t} Feeder {f} Junction {n}" for t, f, n in
+                                               zip(junctions['Transformer_ID'], junctions['Feeder_ID'], junction_no)])
+        # Each feeder's first junction hangs off its busbar, the others off the previous junction
+        first_on_feeder = junction_no == 1
+        upstream = np.where(first_on_feeder,
+                            transformer_bus.loc[junctions['Transformer_ID'].values].values,
+                            np.r_[hv_bus, junction_buses[:-1]])
+        pp.create_lines(net, from_buses=upstream, to_buses=junction_buses, length_km=config['segment_km'],
+                        std_type=config['feeder_std_type'])
+        junction_index = pd.MultiIndex.from_frame(junctions)
+        connection = junction_buses[junction_index.get_indexer(pd.MultiIndex.from_frame(topology_df[keys]))]
+    else:
+        connection = busbar
 
+    # 5. Customer meters on their service cables
+    customer_buses = pp.create_buses(net, len(topology_df), vn_kv=0.4,
+                                     name=[f"Customer Meter {cid}" for cid in topology_df['Customer_ID']])
+    pp.create_lines(net, from_buses=connection, to_buses=customer_buses, length_km=config['service_km'],
+                    std_type=config['service_std_type'])
+
+    # 6. Map customers to the network
+    topology_df['Bus_ID'] = customer_buses
     return net, topology_df
 
-if __name__ == '__main__':
-    net, topology_df = create_egyptian_lv_network()
-    
+def network_cache_key(config, topology_df=None):
+    """
+    Hash of everything that determines the network: the config, if given the topology
+    table, the builder version and the pandapower version (the cached network is a
+    pickle of its objects).
+    """
+    parts = {'config': config, 'builder_version': NETWORK_BUILDER_VERSION, 'pandapower': pp.__version__}
+    if topology_df is not None:
+        parts['topology'] = int(pd.util.hash_pandas_object(topology_df, index=False).sum())
+    return cache_key(**parts)
+
+def load_or_build_network(config=None, topology_df=None, cache_dir=NETWORK_CACHE_DIR, verbose=True):
+    """
+    Returns (net, topology_df) for a config (and optional topology table, otherwise
+    generated from the config), loading them from cache_dir when a network with the
+    same key was built before. The network and its customer mapping are pickled
+    together as plain objects: pp.from_pickle re-validates every table on load and
+    takes longer than building a small network.
+    """
+    config = load_network_config(**(config or {}))
+    key = network_cache_key(config, topology_df)
+    path = os.path.join(cache_dir, f"{key}.pkl")
+
+    start = time.perf_counter()
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            artifact = pickle.load(f)
+        net, topology_df = artifact['net'], artifact['topology']
+        status = "loaded from cache"
+    else:
+        net, topology_df = build_network(generate_topology(config) if topology_df is None else topology_df, config)
+        os.makedirs(cache_dir, exist_ok=True)
+        artifact = {'config': config, 'net': net, 'topology': topology_df}
+        write_atomically(path, lambda f: pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL))
+        status = "built"
+    record('network', status=status, key=key, customers=len(topology_df),
+           seconds=time.perf_counter() - start)
+
+    if verbose:
+        print(f"The virtual electrical network has been successfully {status} "
+              f"in {(time.perf_counter() - start) * 1000:.0f} ms (key {key})!")
+        print(f"Total number of customers: {len(topology_df)} on {topology_df['Transformer_ID'].nunique()} transformer(s)")
+    return net, topology_df
+
+def create_egyptian_lv_network(verbose=True, config=None):
+    """
+    This function builds a virtual three-phase low voltage distribution network
+    with a manually defined transformer to ensure compatibility.
+    By default it is the original 30-customer network; pass a config (see
+    DEFAULT_CONFIG) for larger multi-feeder networks. Set verbose=False to build
+    it silently (e.g. inside worker processes).
+    """
+    net, topology_df = build_network(generate_topology(config), config)
+
+    if verbose:
+        print("The virtual electrical network has been successfully created!")
+        print(f"Total number of customers: {len(topology_df)}")
+
+    return net, topology_df
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Build (or load from cache) the virtual distribution network.")
+    parser.add_argument('--config', help="JSON file overriding DEFAULT_CONFIG")
+    parser.add_argument('--topology', help="CSV topology table (Customer_ID, Transformer_ID, Feeder_ID, Position, Phase)")
+    parser.add_argument('--transformers', type=int, help="Number of transformers")
+    parser.add_argument('--feeders', type=int, help="Feeders per transformer")
+    parser.add_argument('--customers-per-feeder', type=int, help="Customers per feeder")
+    parser.add_argument('--segment-km', type=float, help="Feeder cable length between consecutive customers")
+    args = parser.parse_args(argv)
+
+    config = load_network_config(args.config, transformers=args.transformers, feeders_per_transformer=args.feeders,
+                                 customers_per_feeder=args.customers_per_feeder, segment_km=args.segment_km)
+    topology_df = pd.read_csv(args.topology) if args.topology else None
+    net, topology_df = load_or_build_network(config, topology_df)
+
     print("\n--- Network Summary ---")
     print(net)
-    
+
     print("\n--- Sample of Customer Mapping (first 5 customers) ---")
     print(topology_df.head())
+
+if __name__ == '__main__':
+    main()
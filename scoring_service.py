@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+import json
+import numpy as np
+import pandas as pd
+from detector import (FEATURES, SHARD_COLUMNS, STATE_PATH, TEST_START, load_readings, split_with_phase_totals,
+                      fit_customer_models, load_incremental_state, incremental_state_is_current)
+from storage import read_distinct
+
+class StreamingScorer:
+    """
+    Keeps the per-customer models, phase assignment and running anomaly scores in
+    memory and scores meter readings as they arrive.
+
+    A timestamp is scored once all customers have reported for it, or as soon as a
+    reading for a later timestamp arrives; readings for an already scored timestamp
+    are counted as late and dropped. Scoring a timestamp computes each shard's
+    (transformer and phase) total consumption from its readings, the residual of
+    every reading against its neighbours' total and adds the negative residuals to
+    the customers' scores, as in detector.score_customers. shards labels each
+    customer's shard.
+    """
+
+    def __init__(self, models_df, shards, alert_threshold=-500.0):
+        self.customer_index = models_df.index
+        self.intercept = models_df['Intercept'].to_numpy(dtype=np.float64)
+        self.coef = models_df[FEATURES].to_numpy(dtype=np.float64)
+        self.shard_codes, self.shard_names = pd.factorize(shards.reindex(models_df.index))
+        self.scores = np.zeros(len(models_df))
+        self.alert_threshold = alert_threshold
+        self.alerted = np.zeros(len(models_df), dtype=bool)
+        # Timestamp (ns) -> list of (customer positions, kW, V) arrays not scored yet
+        self.pending = {}
+        self.pending_counts = {}
+        self.last_scored = None
+
+    def process_batch(self, readings):
+        """
+        Adds a micro-batch of (timestamp, customer, kW, V) readings and scores every
+        timestamp that became complete. Returns a summary dict with the alerts raised.
+        """
+        if not readings:
+            return {'accepted': 0, 'late': 0, 'unknown': 0, 'scored_timestamps': 0, 'alerts': []}
+        timestamps, customer_ids, kw, volts = zip(*readings)
+        timestamps = pd.to_datetime(list(timestamps), format='ISO8601').asi8
+        positions = self.customer_index.get_indexer(np.asarray(customer_ids))
+        kw = np.asarray(kw, dtype=np.float64)
+        volts = np.asarray(volts, dtype=np.float64)
+
+        # 1. Drop readings for unknown customers and already scored timestamps
+        known = positions >= 0
+        on_time = known if self.last_scored is None else known & (timestamps > self.last_scored)
+        summary = {'accepted': int(on_time.sum()), 'late': int((known & ~on_time).sum()),
+                   'unknown': int((~known).sum())}
+        timestamps, positions, kw, volts = timestamps[on_time], positions[on_time], kw[on_time], volts[on_time]
+
+        # 2. Buffer the readings per timestamp
+        for timestamp in np.unique(timestamps):
+            mask = timestamps == timestamp
+            self.pending.setdefault(timestamp, []).append((positions[mask], kw[mask], volts[mask]))
+            self.pending_counts[timestamp] = self.pending_counts.get(timestamp, 0) + int(mask.sum())
+
+        # 3. Score complete timestamps and every timestamp older than the newest one
+        newest = max(self.pending, default=None)
+        ready = [timestamp for timestamp in sorted(self.pending)
+                 if timestamp < newest or self.pending_counts[timestamp] >= len(self.customer_index)]
+        summary['scored_timestamps'] = len(ready)
+        summary['alerts'] = [alert for timestamp in ready for alert in self._score_timestamp(timestamp)]
+        return summary
+
+    def flush(self):
+        """Scores every pending timestamp, complete or not. Returns the alerts raised."""
+        alerts = []
+        for timestamp in sorted(self.pending):
+            alerts.extend(self._score_timestamp(timestamp))
+        return alerts
+
+    def _score_timestamp(self, timestamp):
+        chunks = self.pending.pop(timestamp)
+        del self.pending_counts[timestamp]
+        positions, kw, volts = (np.concatenate(parts) for parts in zip(*chunks))
+
+        # Neighbours' total consumption: the shard's total at this timestamp minus the customer's own load
+        reading_shards = self.shard_codes[positions]
+        shard_totals = np.bincount(reading_shards, weights=kw, minlength=len(self.shard_names))
+        X = np.column_stack([volts, shard_totals[reading_shards] - kw])
+
+        predicted_consumption = self.intercept[positions] + np.einsum('ij,ij->i', X, self.coef[positions])
+        residual = kw - predicted_consumption
+        np.add.at(self.scores, positions, np.minimum(residual, 0.0))
+        self.last_scored = timestamp if self.last_scored is None else max(self.last_scored, timestamp)
+
+        # Alert once per customer when the score crosses the threshold
+        crossed = positions[(self.scores[positions] < self.alert_threshold) & ~self.alerted[positions]]
+        crossed = np.unique(crossed)
+        self.alerted[crossed] = True
+        when = str(pd.Timestamp(timestamp))
+        return [{'Customer_ID': int(self.customer_index[pos]), 'Anomaly_Score': float(self.scores[pos]),
+                 'Timestamp': when} for pos in crossed]
+
+    def top_scores(self, top=10):
+        """Returns the most suspicious customers, lowest anomaly score first."""
+        order = np.argsort(self.scores, kind='stable')[:top]
+        return [{'Customer_ID': int(self.customer_index[pos]), 'Anomaly_Score': float(self.scores[pos])}
+                for pos in order]
+
+def load_scoring_models():
+    """
+    Returns the per-customer models and each customer's shard label ('transformer/phase').
+    The models come from the incremental detector state when it exists and still
+    matches the dataset, otherwise they are fitted on the training window of the
+    final dataset.
+    """
+    state = load_incremental_state(STATE_PATH)
+    models_df = state['models'] if incremental_state_is_current(state) else None
+    if models_df is None:
+        train_df, _ = split_with_phase_totals(load_readings(end=TEST_START))
+        models_df = fit_customer_models(train_df)
+    shards = read_distinct('final_dataset_with_theft', ['Customer_ID'] + SHARD_COLUMNS)
+    shards = shards.drop_duplicates('Customer_ID').set_index('Customer_ID')
+    return models_df, shards['Transformer_ID'].astype(str) + '/' + shards['Phase'].astype(str)
+
+async def handle_client(scorer, reader, writer):
+    """
+    Newline-delimited JSON protocol. Each request line is one of:
+        {"readings": [[timestamp, customer_id, kw, voltage], ...]}
+        {"command": "flush"}
+        {"command": "scores", "top": 10}
+    and gets one JSON response line.
+    """
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        try:
+            request = json.loads(line)
+            if 'readings' in request:
+                response = scorer.process_batch(request['readings'])
+            elif request.get('command') == 'flush':
+                response = {'alerts': scorer.flush()}
+            elif request.get('command') == 'scores':
+                response = {'scores': scorer.top_scores(request.get('top', 10))}
+            else:
+                response = {'error': 'unknown request'}
+        except (ValueError, TypeError, KeyError) as e:
+            response = {'error': str(e)}
+        for alert in response.get('alerts', []):
+            print(f"ALERT: Customer #{alert['Customer_ID']} score {alert['Anomaly_Score']:.2f} at {alert['Timestamp']}")
+        writer.write((json.dumps(response) + '\n').encode())
+        await writer.drain()
+    writer.close()
+
+async def serve(scorer, host='127.0.0.1', port=8765):
+    # Micro-batches arrive as single JSON lines, so allow lines well beyond the 64 KiB default
+    server = await asyncio.start_server(lambda r, w: handle_client(scorer, r, w), host, port, limit=2 ** 26)
+    print(f"Scoring service listening on {host}:{port} ({len(scorer.customer_index)} customers)")
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Real-time anomaly scoring service for incoming meter readings.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument('--threshold', type=float, default=-500.0,
+                        help="Raise an alert when a customer's score drops below this value (default: -500)")
+    args = parser.parse_args(argv)
+
+    models_df, shards = load_scoring_models()
+    asyncio.run(serve(StreamingScorer(models_df, shards, args.threshold), args.host, args.port))
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,25 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import pandapower as pp
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+from pandapower.pypower.dSbus_dV import dSbus_dV
 from tqdm import tqdm
 # Import the function that builds the network from the first file
-from network_builder import create_egyptian_lv_network
+from network_builder import load_or_build_network, load_network_config
+from storage import read_dataset, write_dataset
+from theft_scenarios import SIMULATION_RESULTS, DEFAULT_SCENARIOS, apply_scenarios
+from instrumentation import run, stage, record
 
-def run_full_simulation():
+def run_legacy_power_flow(net, merged_df):
     """
-    Main function to run the simulation, merge data, and inject theft scenarios.
+    Original power flow loop: creates every load, solves and drops the loads
+    again for each timestamp. Kept as the reference for the time-series engine.
     """
-    # --- Part 1: Load data and network ---
-    print("1. Loading the network and consumption data...")
-    net, topology_df = create_egyptian_lv_network()
-    consumption_df = pd.read_csv('consumption_data.csv')
-    consumption_df['Timestamp'] = pd.to_datetime(consumption_df['Timestamp'])
-
-    # Merge consumption data with topology to get Bus_ID for each record
-    merged_df = pd.merge(consumption_df, topology_df, on='Customer_ID')
-    
-    # --- Part 2: Run power flow simulation ---
-    print("2. Starting power flow simulation... This process may take some time.")
-    
     all_results = []
+    failed_timestamps = []
     unique_timestamps = merged_df['Timestamp'].unique()
 
     # Use tqdm to show progress bar
@@ -33,7 +32,7 @@ def run_full_simulation():
             # Convert consumption from kW to MW
             p_mw = row['P_consumption_kw'] / 1000
             pp.create_load(net, bus=row['Bus_ID'], p_mw=p_mw, q_mvar=0, name=f"Load C{row['Customer_ID']}")
-        
+
         # *** Run the simulation ***
         try:
             pp.runpp(net)
@@ -44,53 +43,346 @@ def run_full_simulation():
                 vm_pu = net.res_bus.vm_pu.at[bus_id]
                 vn_kv = net.bus.vn_kv.at[bus_id]
                 voltage_v = vm_pu * vn_kv * 1000  # Actual voltage in Volts
-                
+
                 all_results.append({
                     'Timestamp': timestamp,
                     'Customer_ID': row['Customer_ID'],
                     'Phase': row['Phase'],
+                    'Transformer_ID': row['Transformer_ID'],
                     'P_consumption_kw': row['P_consumption_kw'],
                     'Voltage_V': round(voltage_v, 2)
                 })
-        except Exception as e:
+        except pp.LoadflowNotConverged:
             # If the simulation fails (rare), skip this timestamp
-            # print(f"Simulation failed at {timestamp}: {e}")
-            pass
-        
+            failed_timestamps.append(timestamp)
+            record('convergence_failure', timestamp=str(pd.Timestamp(timestamp)))
+
         # Remove loads before next timestamp
         net.load.drop(net.load.index, inplace=True)
 
-    # Convert results to DataFrame
-    ground_truth_df = pd.DataFrame(all_results)
-    
-    print("\n3. Simulation completed! Merging voltage data with consumption.")
-    
-    # --- Part 3: Inject theft scenario ---
-    print("4. Injecting theft scenario...")
-    final_df = ground_truth_df.copy()
+    if failed_timestamps:
+        print(f"WARNING: {len(failed_timestamps)} timestamps did not converge and were skipped: "
+              + ", ".join(str(pd.Timestamp(ts)) for ts in failed_timestamps))
+    return pd.DataFrame(all_results)
+
+def build_load_matrix(merged_df):
+    """
+    Pivots the long consumption records into a (timestamp x customer) matrix in kW.
+    Missing readings are treated as zero load.
+    """
+    matrix_df = merged_df.pivot(index='Timestamp', columns='Customer_ID', values='P_consumption_kw')
+    matrix_df = matrix_df.sort_index().sort_index(axis=1).fillna(0.0)
+    return matrix_df.index.values, matrix_df.columns.values, matrix_df.to_numpy(dtype=np.float64)
+
+def run_time_series_power_flow(net, bus_ids, load_matrix_kw, warm_start=True, restart_every=None,
+                               show_progress=True):
+    """
+    Solves the power flow for every row of load_matrix_kw.
+
+    One load per column is created once; each timestamp only overwrites net.load.p_mw,
+    reuses the cached bus/branch matrices (only PQ injections change) and, when
+    warm_start is set, starts Newton-Raphson from the previous solution.
+    Every restart_every rows (and after a failed solve) the power flow restarts from
+    a flat start, so results only depend on the chunk grid and not on who solves it.
+    Returns the (timestamp x customer) voltage matrix in Volts (NaN where the power
+    flow did not converge) and a boolean convergence mask per timestamp.
+    """
+    num_timestamps, num_customers = load_matrix_kw.shape
+    bus_ids = np.asarray(bus_ids)
+
+    # 1. Build the load table once
+    load_idx = pp.create_loads(net, buses=bus_ids, p_mw=0.0, q_mvar=0.0,
+                               name=[f"Load B{bus_id}" for bus_id in bus_ids])
+    load_matrix_mw = load_matrix_kw / 1000
+
+    # 2. Preallocate outputs and resolve bus positions once
+    voltages_v = np.full((num_timestamps, num_customers), np.nan)
+    converged = np.zeros(num_timestamps, dtype=bool)
+    bus_pos = net.bus.index.get_indexer(bus_ids)
+    vn_v = net.bus.vn_kv.values[bus_pos] * 1000
+
+    recycle = dict(trafo=False, gen=False, bus_pq=True)
+    restart = True
+    try:
+        for t in tqdm(range(num_timestamps), desc="Simulating time periods", disable=not show_progress):
+            if restart_every and t % restart_every == 0:
+                restart = True
+            net.load.loc[load_idx, 'p_mw'] = load_matrix_mw[t]
+            try:
+                if restart:
+                    pp.runpp(net, init='auto')
+                else:
+                    pp.runpp(net, init='results', recycle=recycle)
+            except pp.LoadflowNotConverged:
+                # Start the next timestamp from scratch instead of a failed solution
+                restart = True
+                continue
+            voltages_v[t] = net.res_bus.vm_pu.values[bus_pos] * vn_v
+            converged[t] = True
+            restart = not warm_start
+    finally:
+        # Leave the network as we found it
+        net.load.drop(load_idx, inplace=True)
+
+    return voltages_v, converged
+
+def linearize_power_flow(net, bus_ids, p0_kw, block_size=512):
+    """
+    Linearizes the power flow around the operating point with loads p0_kw.
+
+    Solves one Newton-Raphson power flow, builds the sparse power flow Jacobian at
+    that solution and factorizes it once (sparse LU). Returns (v0_v, voltages) where
+    v0_v are the customer voltages (in Volts) at the operating point and
+    voltages(load_kw) gives the linearized voltages for a (timestamp x customer) load
+    matrix, solving the factorized Jacobian for the load changes of block_size
+    timestamps at a time. The dense customer x customer sensitivity matrix is never
+    formed: it is mostly zeros (transformers are decoupled behind the slack bus) and
+    its size grows with the square of the customer count.
+    """
+    bus_ids = np.asarray(bus_ids)
+    load_idx = pp.create_loads(net, buses=bus_ids, p_mw=np.asarray(p0_kw) / 1000, q_mvar=0.0)
+    try:
+        pp.runpp(net)
+        internal = net._ppc['internal']
+        V = internal['V']
+        base_mva = net._ppc['baseMVA']
+        pv, pq = internal['pv'], internal['pq']
+    finally:
+        net.load.drop(load_idx, inplace=True)
+
+    # 1. Sparse Jacobian of the bus power injections at the operating point
+    pvpq = np.r_[pv, pq]
+    dS_dVm, dS_dVa = dSbus_dV(internal['Ybus'], V)
+    jacobian = sp.vstack([
+        sp.hstack([dS_dVa[pvpq][:, pvpq].real, dS_dVm[pvpq][:, pq].real]),
+        sp.hstack([dS_dVa[pq][:, pvpq].imag, dS_dVm[pq][:, pq].imag]),
+    ]).tocsc()
+    lu = splu(jacobian)
+
+    # 2. Rows/columns of the customer buses in the Jacobian
+    ppc_bus = net._pd2ppc_lookups['bus'][bus_ids]
+    p_rows = pd.Index(pvpq).get_indexer(ppc_bus)
+    vm_rows = len(pvpq) + pd.Index(pq).get_indexer(ppc_bus)
+    vn_v = net.bus.vn_kv.values[net.bus.index.get_indexer(bus_ids)] * 1000
+
+    # 3. Maps customer load changes to power injection rows; a load of 1 kW is an injection of -0.001 MW
+    num_customers = len(bus_ids)
+    injection = sp.csr_matrix((np.full(num_customers, -0.001 / base_mva), (p_rows, np.arange(num_customers))),
+                              shape=(jacobian.shape[0], num_customers))
+    v0_v = np.abs(V[ppc_bus]) * vn_v
+    p0_kw = np.asarray(p0_kw)
+
+    def voltages(load_kw):
+        voltages_v = np.empty(load_kw.shape)
+        for first in range(0, len(load_kw), block_size):
+            rows = slice(first, first + block_size)
+            delta_v = lu.solve(injection @ (load_kw[rows] - p0_kw).T)[vm_rows] * vn_v[:, None]
+            voltages_v[rows] = v0_v + delta_v.T
+        return voltages_v
+
+    return v0_v, voltages
+
+def run_linearized_power_flow(net, bus_ids, load_matrix_kw, num_samples=24):
+    """
+    Computes the voltages for every timestamp from the linearized power flow,
+    linearized around each customer's mean load.
+
+    The linearization error is checked with full Newton-Raphson solves on
+    num_samples timestamps (evenly spaced, plus the lowest and highest total load).
+    Returns the (timestamp x customer) voltage matrix in Volts and the largest
+    error found on the sampled timestamps.
+    """
+    p0_kw = load_matrix_kw.mean(axis=0)
+    _, voltages = linearize_power_flow(net, bus_ids, p0_kw)
+    voltages_v = voltages(load_matrix_kw)
+
+    total_load = load_matrix_kw.sum(axis=1)
+    samples = np.unique(np.r_[np.linspace(0, len(load_matrix_kw) - 1, num_samples).astype(int),
+                              total_load.argmin(), total_load.argmax()])
+    sample_voltages_v, _ = run_time_series_power_flow(net, bus_ids, load_matrix_kw[samples], warm_start=False,
+                                                      show_progress=False)
+    max_error_v = np.nanmax(np.abs(sample_voltages_v - voltages_v[samples]))
+    return voltages_v, max_error_v
+
+def split_into_chunks(num_timestamps, chunk_size):
+    """Returns (start, stop) row ranges covering num_timestamps in chunks of chunk_size."""
+    return [(start, min(start + chunk_size, num_timestamps)) for start in range(0, num_timestamps, chunk_size)]
+
+# Network owned by each worker process, built once by _init_worker
+_worker_net = None
+
+def _init_worker(network_config):
+    global _worker_net
+    _worker_net, _ = load_or_build_network(network_config, verbose=False)
+
+def _solve_chunk(task):
+    bus_ids, load_chunk_kw = task
+    return run_time_series_power_flow(_worker_net, bus_ids, load_chunk_kw, show_progress=False)
+
+def run_parallel_power_flow(bus_ids, load_matrix_kw, workers, chunk_size=96, network_config=None):
+    """
+    Shards the timestamps into chunks of chunk_size rows and solves them across
+    `workers` processes, each loading its own copy of the network for network_config.
+    The partial voltage arrays are merged back in timestamp order; the output is
+    identical to run_time_series_power_flow(..., restart_every=chunk_size).
+    """
+    num_timestamps, num_customers = load_matrix_kw.shape
+    chunks = split_into_chunks(num_timestamps, chunk_size)
+    tasks = [(bus_ids, load_matrix_kw[start:stop]) for start, stop in chunks]
+
+    voltages_v = np.empty((num_timestamps, num_customers))
+    converged = np.empty(num_timestamps, dtype=bool)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(network_config,)) as executor:
+        results = executor.map(_solve_chunk, tasks)
+        for (start, stop), (chunk_voltages, chunk_converged) in tqdm(zip(chunks, results), total=len(chunks),
+                                                                     desc="Simulating chunks"):
+            voltages_v[start:stop] = chunk_voltages
+            converged[start:stop] = chunk_converged
+
+    return voltages_v, converged
+
+def report_convergence_failures(timestamps, converged, chunk_size):
+    """Prints the timestamps whose power flow did not converge, grouped by chunk."""
+    failed_chunks = []
+    for chunk_no, (start, stop) in enumerate(split_into_chunks(len(timestamps), chunk_size)):
+        failed = np.asarray(timestamps)[start:stop][~converged[start:stop]]
+        if len(failed):
+            failed_chunks.append((chunk_no, failed))
+            for ts in failed:
+                record('convergence_failure', timestamp=str(pd.Timestamp(ts)), chunk=chunk_no)
+
+    if not failed_chunks:
+        print("All power flow timestamps converged.")
+        return failed_chunks
+
+    print(f"WARNING: {int((~converged).sum())} timestamps did not converge and were skipped:")
+    for chunk_no, failed in failed_chunks:
+        print(f"  Chunk {chunk_no}: " + ", ".join(str(pd.Timestamp(ts)) for ts in failed))
+    return failed_chunks
+
+def time_series_results_to_frame(timestamps, topology_df, load_matrix_kw, voltages_v, converged):
+    """
+    Flattens the time-series engine output into the long format produced by the
+    legacy loop. Timestamps that did not converge are skipped, as before.
+    """
+    num_customers = len(topology_df)
+    timestamps = np.asarray(timestamps)[converged]
+    ground_truth_df = pd.DataFrame({
+        'Timestamp': np.repeat(timestamps, num_customers),
+        'Customer_ID': np.tile(topology_df['Customer_ID'].values, len(timestamps)),
+        'Phase': np.tile(topology_df['Phase'].values, len(timestamps)),
+        'Transformer_ID': np.tile(topology_df['Transformer_ID'].values, len(timestamps)),
+        'P_consumption_kw': load_matrix_kw[converged].ravel(),
+        'Voltage_V': np.round(voltages_v[converged], 2).ravel()
+    })
+    return ground_truth_df
+
+def run_full_simulation(engine='timeseries', workers=1, chunk_size=96, fmt='parquet', solver='newton',
+                        tolerance_v=0.01, network_config=None, scenarios_df=DEFAULT_SCENARIOS, seed=0):
+    """
+    Main function to run the simulation, merge data, and inject theft scenarios.
+
+    engine='timeseries' builds the load table once and only updates the load
+    values per timestamp; engine='legacy' keeps the original per-timestamp loop.
+    With workers > 1 the time-series engine shards the timestamps into chunks of
+    chunk_size across worker processes. solver='linear' computes all timestamps
+    at once from the linearized power flow and falls back to Newton-Raphson when
+    its error on sampled timestamps exceeds tolerance_v Volts. network_config
+    selects the network (see network_builder.DEFAULT_CONFIG); it is loaded from
+    the network cache when it was built before. The power flow results are saved
+    as simulation_results, then every theft scenario in scenarios_df (see
+    theft_scenarios.py) is injected in one pass. The final dataset is written as
+    fmt ('parquet' or 'csv').
+    """
+    # --- Part 1: Load data and network ---
+    print("1. Loading the network and consumption data...")
+    with stage('network') as info:
+        net, topology_df = load_or_build_network(network_config)
+        info.update(customers=len(topology_df), buses=len(net.bus))
+    with stage('load') as info:
+        consumption_df = read_dataset('consumption_data', columns=['Timestamp', 'Customer_ID', 'P_consumption_kw'])
+        info['rows'] = len(consumption_df)
+
+    # Merge consumption data with topology to get Bus_ID for each record
+    merged_df = pd.merge(consumption_df, topology_df, on='Customer_ID')
     
-    # Select the stealing customer (e.g., Customer 5)
-    thief_id = 5
-    # Define theft start date (after 2 months)
-    theft_start_date = pd.to_datetime('2023-03-01')
+    # --- Part 2: Run power flow simulation ---
+    print("2. Starting power flow simulation... This process may take some time.")
+    with stage('power_flow', engine=engine, solver=solver, workers=workers) as info:
+        if engine == 'legacy':
+            ground_truth_df = run_legacy_power_flow(net, merged_df)
+        else:
+            timestamps, customer_ids, load_matrix_kw = build_load_matrix(merged_df)
+            topology_df = topology_df.set_index('Customer_ID').loc[customer_ids].reset_index()
+            bus_ids = topology_df['Bus_ID'].values
+            voltages_v = None
+            if solver == 'linear':
+                voltages_v, max_error_v = run_linearized_power_flow(net, bus_ids, load_matrix_kw)
+                # NaN when no sampled Newton-Raphson solve converged, which also falls back
+                fallback = not (max_error_v <= tolerance_v)
+                record('linearization', max_error_v=float(max_error_v), tolerance_v=tolerance_v, fallback=fallback)
+                if not fallback:
+                    print(f"   Linearized power flow: max error {max_error_v:.4f} V on sampled timestamps.")
+                    converged = np.ones(len(timestamps), dtype=bool)
+                else:
+                    print(f"   Linearized power flow error {max_error_v:.4f} V exceeds {tolerance_v} V; "
+                          f"falling back to Newton-Raphson.")
+                    voltages_v = None
+            if voltages_v is None and workers > 1:
+                voltages_v, converged = run_parallel_power_flow(bus_ids, load_matrix_kw, workers, chunk_size,
+                                                                network_config)
+            elif voltages_v is None:
+                voltages_v, converged = run_time_series_power_flow(net, bus_ids, load_matrix_kw,
+                                                                   restart_every=chunk_size)
+            report_convergence_failures(timestamps, converged, chunk_size)
+            ground_truth_df = time_series_results_to_frame(timestamps, topology_df, load_matrix_kw, voltages_v, converged)
+        info.update(rows=len(ground_truth_df), timesteps=int(ground_truth_df['Timestamp'].nunique()))
     
-    # Filter data for the thief after the theft start date
-    theft_indices = final_df[(final_df['Customer_ID'] == thief_id) & (final_df['Timestamp'] >= theft_start_date)].index
+    print("\n3. Simulation completed! Merging voltage data with consumption.")
     
-    # Manipulate the meter: reduce recorded consumption by 90%
+    # --- Part 3: Save the power flow results and inject theft scenarios ---
+    # The saved results let theft_scenarios.py build new labelled variants without re-running the power flow
+    with stage('save', dataset=SIMULATION_RESULTS, rows=len(ground_truth_df)):
+        write_dataset(ground_truth_df, SIMULATION_RESULTS, fmt)
+    print(f"4. Injecting {len(scenarios_df)} theft scenario(s)...")
     # Keep the voltage unchanged since it reflects the actual high consumption
-    final_df.loc[theft_indices, 'P_consumption_kw'] *= 0.1
-    
-    # Add a column to indicate theft (for evaluation purposes later)
-    final_df['Is_Theft'] = 0
-    final_df.loc[theft_indices, 'Is_Theft'] = 1
+    with stage('inject', rows=len(ground_truth_df), scenarios=len(scenarios_df)) as info:
+        final_df = apply_scenarios(ground_truth_df, scenarios_df, seed)
+        info['theft_rows'] = int(final_df['Is_Theft'].sum())
 
     # 5. Save the final dataset
-    file_path = 'final_dataset_with_theft.csv'
-    final_df.to_csv(file_path, index=False)
+    with stage('save', dataset='final_dataset_with_theft', rows=len(final_df)):
+        file_path = write_dataset(final_df, 'final_dataset_with_theft', fmt)
     
     print(f"\nStep 3 completed successfully!")
     print(f"Final dataset ready for training has been saved to: {file_path}")
 
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Run the power flow simulation and inject theft scenarios.")
+    parser.add_argument('--engine', choices=['timeseries', 'legacy'], default='timeseries',
+                        help="Power flow engine (default: timeseries)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes for the time-series engine (default: 1)")
+    parser.add_argument('--chunk-size', type=int, default=96,
+                        help="Timestamps per chunk; power flow restarts from a flat start at each chunk (default: 96 = one day)")
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet',
+                        help="Storage format of the final dataset (default: parquet)")
+    parser.add_argument('--solver', choices=['newton', 'linear'], default='newton',
+                        help="Time-series solver: full Newton-Raphson or linearized power flow (default: newton)")
+    parser.add_argument('--tolerance', type=float, default=0.01,
+                        help="Largest linearization error in Volts before falling back to Newton-Raphson (default: 0.01)")
+    parser.add_argument('--network-config', help="JSON file overriding network_builder.DEFAULT_CONFIG")
+    parser.add_argument('--scenarios', help="CSV theft scenario table (default: Customer 5 reports 10%% from 2023-03-01)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for intermittent theft scenarios (default: 0)")
+    parser.add_argument('--events', help="Append the run's stage events to this JSON Lines file")
+    parser.add_argument('--profile', help="Profile the run with cProfile and write the stats to this file")
+    args = parser.parse_args(argv)
+    with run('simulation', events_path=args.events, profile_path=args.profile, verbose=True):
+        run_full_simulation(engine=args.engine, workers=args.workers, chunk_size=args.chunk_size, fmt=args.format,
+                            solver=args.solver, tolerance_v=args.tolerance,
+                            network_config=load_network_config(args.network_config),
+                            scenarios_df=pd.read_csv(args.scenarios) if args.scenarios else DEFAULT_SCENARIOS,
+                            seed=args.seed)
+
 if __name__ == '__main__':
-    run_full_simulation()
+    main()
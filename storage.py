@@ -0,0 +1,216 @@
+import argparse
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Column types shared by every stage of the pipeline
+COLUMN_TYPES = {
+    'Timestamp': 'datetime64[ns]',
+    'Customer_ID': 'int32',
+    'Phase': 'category',
+    'Transformer_ID': 'int32',
+    'P_consumption_kw': 'float32',
+    'Voltage_V': 'float32',
+    'Is_Theft': 'int8',
+    'Anomaly_Score': 'float64',
+}
+
+# Row groups are capped so time-window reads (iter_dataset) only decode the row groups they overlap
+ROW_GROUP_ROWS = 65536
+
+# Parquet datasets are split into one directory per month (and per phase and transformer when present)
+PARTITION_COLUMNS = ['Month', 'Phase', 'Transformer_ID']
+
+def dataset_path(name, fmt):
+    """Returns the on-disk path of a dataset, e.g. 'final_dataset_with_theft.parquet'."""
+    return f"{name}.{fmt}"
+
+def resolve_format(name):
+    """
+    Returns the format ('parquet' or 'csv') of the most recently written copy of a
+    dataset, or raises FileNotFoundError if neither exists.
+    """
+    candidates = [fmt for fmt in ('parquet', 'csv') if os.path.exists(dataset_path(name, fmt))]
+    if not candidates:
+        raise FileNotFoundError(f"'{dataset_path(name, 'parquet')}' / '{dataset_path(name, 'csv')}' not found.")
+    return max(candidates, key=lambda fmt: os.path.getmtime(dataset_path(name, fmt)))
+
+def apply_schema(df):
+    """Casts the known pipeline columns to their storage types, in pipeline column order."""
+    df = df.astype({col: dtype for col, dtype in COLUMN_TYPES.items() if col in df.columns})
+    ordered = [col for col in COLUMN_TYPES if col in df.columns]
+    return df[ordered + [col for col in df.columns if col not in ordered]]
+
+def _month_labels(timestamps):
+    # Label each row with its 'YYYY-MM' month without formatting every timestamp
+    months, codes = np.unique(timestamps.values.astype('datetime64[M]'), return_inverse=True)
+    return pd.Categorical.from_codes(codes, categories=months.astype(str))
+
+def write_dataset(df, name, fmt='parquet', append=False, part=0):
+    """
+    Writes a pipeline dataset with typed columns.
+
+    fmt='parquet' writes a dataset directory partitioned by month, phase and
+    transformer (when the frame has those columns), so one transformer's phase can
+    be read without touching the others; fmt='csv' writes the classic flat CSV export.
+    With append=True the frame is added to an existing dataset as chunk `part`,
+    which lets generators stream their output chunk by chunk.
+    """
+    df = apply_schema(df)
+    path = dataset_path(name, fmt)
+
+    if fmt == 'csv':
+        df.to_csv(path, mode='a' if append else 'w', header=not append, index=False)
+        return path
+    if fmt != 'parquet':
+        raise ValueError(f"Unknown storage format: {fmt!r}")
+
+    if not append and os.path.exists(path):
+        shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+
+    if 'Timestamp' not in df.columns:
+        df.to_parquet(path, index=False)
+        return path
+
+    table = pa.Table.from_pandas(df.assign(Month=_month_labels(df['Timestamp'])), preserve_index=False)
+    pq.write_to_dataset(table, path, partition_cols=[col for col in PARTITION_COLUMNS if col in table.column_names],
+                        basename_template=f"part-{part}-{{i}}.parquet", max_partitions=1_000_000,
+                        max_rows_per_group=ROW_GROUP_ROWS)
+    return path
+
+def _filter_frame(df, months=None, phases=None, transformers=None, start=None, end=None):
+    # Applies read_dataset's filters to an in-memory frame (CSV datasets)
+    if 'Timestamp' in df.columns:
+        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+    if months is not None:
+        df = df[df['Timestamp'].dt.strftime('%Y-%m').isin(months)]
+    if phases is not None:
+        df = df[df['Phase'].isin(phases)]
+    if transformers is not None:
+        df = df[df['Transformer_ID'].isin(transformers)]
+    if start is not None:
+        df = df[df['Timestamp'] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df['Timestamp'] < pd.Timestamp(end)]
+    return df
+
+def _parquet_filters(months=None, phases=None, transformers=None, start=None, end=None):
+    # read_dataset's filters in pyarrow's DNF form, so they are pushed down to the files
+    filters = []
+    if months is not None:
+        filters.append(('Month', 'in', list(months)))
+    if phases is not None:
+        filters.append(('Phase', 'in', list(phases)))
+    if transformers is not None:
+        filters.append(('Transformer_ID', 'in', [int(t) for t in transformers]))
+    if start is not None:
+        # datetime64 keeps nanosecond precision; pd.Timestamp filters are truncated to microseconds
+        filters.append(('Timestamp', '>=', pd.Timestamp(start).to_datetime64()))
+    if end is not None:
+        filters.append(('Timestamp', '<', pd.Timestamp(end).to_datetime64()))
+    return filters
+
+def _sorted_frame(df):
+    # Typed columns, sorted by time then customer
+    df = apply_schema(df.drop(columns='Month', errors='ignore'))
+    if 'Timestamp' in df.columns:
+        sort_keys = [col for col in ('Timestamp', 'Customer_ID') if col in df.columns]
+        df = df.sort_values(sort_keys, kind='stable')
+    return df.reset_index(drop=True)
+
+def read_dataset(name, columns=None, months=None, phases=None, start=None, end=None, fmt=None, transformers=None):
+    """
+    Reads a pipeline dataset back with typed columns, sorted by time.
+
+    columns limits the columns that are read. months ('YYYY-MM') and phases select
+    partitions, transformers selects Transformer_IDs and start/end bound the
+    timestamps; for Parquet these filters are pushed down, so only the matching
+    files and row groups are read and only the matching rows are kept.
+    """
+    fmt = fmt or resolve_format(name)
+    path = dataset_path(name, fmt)
+
+    if fmt == 'csv':
+        df = _filter_frame(pd.read_csv(path, usecols=columns), months, phases, transformers, start, end)
+    else:
+        filters = _parquet_filters(months, phases, transformers, start, end)
+        df = pd.read_parquet(path, engine='pyarrow', columns=columns, filters=filters or None)
+    return _sorted_frame(df)
+
+def iter_dataset(name, columns=None, chunk='1D', phases=None, start=None, end=None, fmt=None, transformers=None,
+                 csv_rows=1_000_000):
+    """
+    Reads a time-indexed pipeline dataset in time order, one window of `chunk` (a
+    pandas frequency such as '1D') at a time, so only one chunk is held in memory.
+    Every chunk holds all the selected rows of the timestamps it covers. Filters
+    are the same as read_dataset's. For Parquet, each window is read with its
+    timestamp range pushed down to the files' row groups; CSV files are scanned in
+    blocks of csv_rows rows.
+    """
+    fmt = fmt or resolve_format(name)
+    path = dataset_path(name, fmt)
+
+    if fmt == 'csv':
+        # Carry the rows after the last complete window over to the next block
+        pending = None
+        for block in pd.read_csv(path, usecols=columns, chunksize=csv_rows):
+            block = _filter_frame(block, phases=phases, transformers=transformers, start=start, end=end)
+            pending = block if pending is None else pd.concat([pending, block], ignore_index=True)
+            if not len(pending):
+                continue
+            window = pending['Timestamp'].dt.floor(chunk)
+            complete = (window < window.iloc[-1]).to_numpy()
+            for _, window_df in pending[complete].groupby(window[complete], sort=True):
+                yield _sorted_frame(window_df)
+            pending = pending[~complete]
+        if pending is not None and len(pending):
+            yield _sorted_frame(pending)
+        return
+
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    months = sorted({ds.get_partition_keys(fragment.partition_expression)['Month']
+                     for fragment in dataset.get_fragments()})
+    for month in months:
+        month_start = pd.Timestamp(month)
+        month_end = month_start + pd.offsets.MonthBegin(1)
+        bounds = pd.date_range(month_start, month_end, freq=chunk).append(pd.DatetimeIndex([month_end])).unique()
+        for window_start, window_end in zip(bounds[:-1], bounds[1:]):
+            window_start = window_start if start is None else max(window_start, pd.Timestamp(start))
+            window_end = window_end if end is None else min(window_end, pd.Timestamp(end))
+            if window_start >= window_end:
+                continue
+            filters = _parquet_filters([month], phases, transformers, window_start, window_end)
+            table = dataset.to_table(columns=columns, filter=pq.filters_to_expression(filters))
+            if table.num_rows:
+                yield _sorted_frame(table.to_pandas())
+
+def read_distinct(name, columns, fmt=None):
+    """
+    Returns the distinct combinations of some columns (e.g. each customer's phase),
+    scanning the dataset batch by batch instead of loading it.
+    """
+    fmt = fmt or resolve_format(name)
+    path = dataset_path(name, fmt)
+    if fmt == 'csv':
+        batches = pd.read_csv(path, usecols=columns, chunksize=1_000_000)
+    else:
+        dataset = ds.dataset(path, format='parquet', partitioning='hive')
+        batches = (batch.to_pandas() for batch in dataset.to_batches(columns=columns))
+    distinct = pd.concat([batch.drop_duplicates() for batch in batches]).drop_duplicates()
+    return apply_schema(distinct)[columns].sort_values(columns).reset_index(drop=True)
+
+def export_csv(name):
+    """Exports a Parquet dataset to '<name>.csv'."""
+    df = read_dataset(name, fmt='parquet')
+    return write_dataset(df, name, fmt='csv')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export a Parquet pipeline dataset to CSV.")
+    parser.add_argument('name', choices=['consumption_data', 'final_dataset_with_theft', 'anomaly_results'],
+                        help="Dataset to export")
+    args = parser.parse_args()
+    print(f"Exported to: {export_csv(args.name)}")
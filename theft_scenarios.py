@@ -0,0 +1,162 @@
+import argparse
+import numpy as np
+import pandas as pd
+from storage import read_dataset, read_distinct, write_dataset
+from instrumentation import run, stage
+
+# Power flow results without any theft; every labelled variant is derived from them
+SIMULATION_RESULTS = 'simulation_results'
+PATTERNS = ['constant', 'night', 'intermittent', 'ramp']
+
+# One row per manipulated meter. Fraction is the share of the real consumption the
+# meter still reports while the theft is active. Optional columns and their defaults:
+SCENARIO_DEFAULTS = {
+    'End': pd.NaT,              # Theft stops at this time (NaT = never)
+    'Night_Start_Hour': 0,      # 'night': bypass active from this hour...
+    'Night_End_Hour': 6,        # ...until this hour (may wrap past midnight)
+    'Duty_Cycle': 0.5,          # 'intermittent': share of days the bypass is active
+    'Ramp_Days': 30,            # 'ramp': days over which reporting falls from 100% to Fraction
+}
+
+# The original scenario: Customer 5 under-reports by 90% from 2023-03-01 (after 2 months)
+DEFAULT_SCENARIOS = pd.DataFrame({'Customer_ID': [5], 'Pattern': ['constant'],
+                                  'Start': [pd.Timestamp('2023-03-01')], 'Fraction': [0.1]})
+
+def normalize_scenarios(scenarios_df):
+    """Fills the optional scenario columns with their defaults and checks the patterns."""
+    scenarios_df = scenarios_df.copy()
+    for column, default in SCENARIO_DEFAULTS.items():
+        if column not in scenarios_df.columns:
+            scenarios_df[column] = default
+        elif not pd.isna(default):
+            scenarios_df[column] = scenarios_df[column].fillna(default)
+    scenarios_df['Start'] = pd.to_datetime(scenarios_df['Start'])
+    scenarios_df['End'] = pd.to_datetime(scenarios_df['End'])
+    unknown = set(scenarios_df['Pattern']) - set(PATTERNS)
+    if unknown:
+        raise ValueError(f"Unknown theft pattern(s): {sorted(unknown)}; expected one of {PATTERNS}")
+    return scenarios_df.reset_index(drop=True)
+
+def random_scenarios(customer_ids, num_thieves, start='2023-03-01', seed=0):
+    """
+    Draws a scenario table with num_thieves distinct customers, spread evenly over the
+    patterns, reporting between 5% and 50% of their consumption, starting within two
+    weeks of start.
+    """
+    rng = np.random.default_rng(seed)
+    thieves = np.sort(rng.choice(np.asarray(customer_ids), num_thieves, replace=False))
+    return normalize_scenarios(pd.DataFrame({
+        'Customer_ID': thieves,
+        'Pattern': rng.permutation(np.resize(PATTERNS, num_thieves)),
+        'Start': pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, 14 * 96, num_thieves) * 15, unit='min'),
+        'Fraction': np.round(rng.uniform(0.05, 0.5, num_thieves), 2),
+        'Night_Start_Hour': rng.choice([22, 23, 0], num_thieves),
+        'Night_End_Hour': rng.choice([5, 6, 7], num_thieves),
+        'Duty_Cycle': np.round(rng.uniform(0.3, 0.7, num_thieves), 2),
+        'Ramp_Days': rng.integers(7, 45, num_thieves),
+    }))
+
+def theft_factors(timestamps, scenarios_df, seed=0):
+    """
+    Computes the (timestamp x scenario) matrix of reported / real consumption for
+    every scenario at once: 1 where the meter is honest, below 1 while it is
+    manipulated.
+    """
+    timestamps = pd.DatetimeIndex(timestamps)
+    t = timestamps.values[:, None]
+    scenario = {column: scenarios_df[column].to_numpy()[None, :] for column in scenarios_df.columns}
+    fraction = scenario['Fraction'].astype(np.float64)
+
+    # 1. Theft window of every scenario
+    # Comparisons with a NaT end are always False, so open-ended thefts never stop
+    active = (t >= scenario['Start']) & ~(t >= scenario['End'])
+
+    # 2. Pattern-specific activity and reported fraction
+    hour = timestamps.hour.values[:, None]
+    night_start, night_end = scenario['Night_Start_Hour'], scenario['Night_End_Hour']
+    at_night = np.where(night_start < night_end, (hour >= night_start) & (hour < night_end),
+                        (hour >= night_start) | (hour < night_end))
+
+    days = timestamps.normalize()
+    day_codes, unique_days = pd.factorize(days)
+    rng = np.random.default_rng(seed)
+    on_day = (rng.random((len(unique_days), scenarios_df.shape[0])) < scenario['Duty_Cycle'])[day_codes]
+
+    elapsed_days = (t - scenario['Start']) / np.timedelta64(1, 'D')
+    ramp = np.clip(elapsed_days / np.maximum(scenario['Ramp_Days'].astype(np.float64), 1e-9), 0.0, 1.0)
+
+    pattern = scenario['Pattern']
+    active &= np.select([pattern == 'night', pattern == 'intermittent'], [at_night, on_day], True)
+    reported = np.where(pattern == 'ramp', 1.0 - (1.0 - fraction) * ramp, fraction)
+    return np.where(active, reported, 1.0)
+
+def apply_scenarios(df, scenarios_df, seed=0):
+    """
+    Applies all theft scenarios to a long-format frame of real readings in one
+    vectorized pass and returns a copy with the reported P_consumption_kw and an
+    Is_Theft label per row. Voltages are left unchanged since they reflect the real
+    consumption. A customer with several scenario rows gets their combined effect.
+    """
+    scenarios_df = normalize_scenarios(scenarios_df)
+    time_codes, timestamps = pd.factorize(df['Timestamp'], sort=True)
+    thieves, scenario_customer = np.unique(scenarios_df['Customer_ID'].to_numpy(), return_inverse=True)
+
+    # (timestamp x thief) factors, combining scenarios that target the same customer
+    factors = np.ones((len(timestamps), len(thieves)))
+    np.multiply.at(factors.T, scenario_customer, theft_factors(timestamps, scenarios_df, seed).T)
+
+    thief_codes = pd.Index(thieves).get_indexer(df['Customer_ID'].to_numpy())
+    row_factors = np.ones(len(df))
+    is_thief = thief_codes >= 0
+    row_factors[is_thief] = factors[time_codes[is_thief], thief_codes[is_thief]]
+
+    return df.assign(P_consumption_kw=df['P_consumption_kw'].to_numpy() * row_factors,
+                     Is_Theft=(row_factors < 1.0).astype(np.int8))
+
+def create_labelled_dataset(scenarios_df, output='final_dataset_with_theft', fmt='parquet', seed=0):
+    """
+    Builds a labelled dataset from the saved power flow results, so new scenario
+    mixes never re-run the power flow. Returns the path written.
+    """
+    with stage('load', dataset=SIMULATION_RESULTS) as info:
+        df = read_dataset(SIMULATION_RESULTS, columns=['Timestamp', 'Customer_ID', 'Phase', 'Transformer_ID',
+                                                       'P_consumption_kw', 'Voltage_V'])
+        info['rows'] = len(df)
+    with stage('inject', rows=len(df), scenarios=len(scenarios_df)) as info:
+        final_df = apply_scenarios(df, scenarios_df, seed)
+        info['theft_rows'] = int(final_df['Is_Theft'].sum())
+    num_thieves = final_df.loc[final_df['Is_Theft'] == 1, 'Customer_ID'].nunique()
+    print(f"Injected {len(scenarios_df)} scenarios: {num_thieves} customers, "
+          f"{int(final_df['Is_Theft'].sum())} manipulated readings.")
+    with stage('save', dataset=output, rows=len(final_df)):
+        return write_dataset(final_df, output, fmt)
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Create a labelled dataset from the saved power flow results.")
+    parser.add_argument('--scenarios', help="CSV scenario table (Customer_ID, Pattern, Start, Fraction, ...)")
+    parser.add_argument('--random', type=int, help="Draw this many random thieves instead of reading a table")
+    parser.add_argument('--start', default='2023-03-01', help="Earliest start of the random scenarios (default: 2023-03-01)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for random and intermittent scenarios (default: 0)")
+    parser.add_argument('--output', default='final_dataset_with_theft',
+                        help="Name of the dataset to write (default: final_dataset_with_theft)")
+    parser.add_argument('--save-scenarios', help="Also write the scenario table to this CSV file")
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet',
+                        help="Storage format of the dataset (default: parquet)")
+    parser.add_argument('--events', help="Append the run's stage events to this JSON Lines file")
+    parser.add_argument('--profile', help="Profile the run with cProfile and write the stats to this file")
+    args = parser.parse_args(argv)
+
+    if args.random:
+        customer_ids = read_distinct(SIMULATION_RESULTS, ['Customer_ID'])['Customer_ID']
+        scenarios_df = random_scenarios(customer_ids, args.random, args.start, args.seed)
+    elif args.scenarios:
+        scenarios_df = pd.read_csv(args.scenarios)
+    else:
+        scenarios_df = DEFAULT_SCENARIOS
+    if args.save_scenarios:
+        scenarios_df.to_csv(args.save_scenarios, index=False)
+    with run('theft_scenarios', events_path=args.events, profile_path=args.profile, verbose=True):
+        print(f"Dataset saved to: {create_labelled_dataset(scenarios_df, args.output, args.format, args.seed)}")
+
+if __name__ == '__main__':
+    main()